@@ -1,6 +1,32 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import sqlite3
+import re
+from contextlib import contextmanager
+import queue
+import threading
+import argparse
+import csv
+import json
+import os
+import sys
+import configparser
+import unicodedata
+import difflib
+import time
+import random
+import platform
+import statistics
+import tempfile
+import bisect
+import functools
+import itertools
+from array import array
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
 
 # Tooltip class for displaying tooltips
 class ToolTip:
@@ -31,105 +57,2814 @@ class ToolTip:
         if tw:
             tw.destroy()
 
+# SQLite performance profile applied when connecting. WAL lets readers
+# (exports, reports, other GUI instances) run alongside a writer, and
+# synchronous=NORMAL only fsyncs at WAL checkpoints instead of every commit.
+# auto_vacuum only takes effect when a database is created or VACUUMed; with
+# INCREMENTAL the pages freed by deletes are returned by `maintain vacuum`.
+DEFAULT_DB_SETTINGS = {
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,       # Negative values are KiB, i.e. 64 MiB of page cache
+    "mmap_size": 268435456,     # 256 MiB of memory-mapped I/O
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,       # Milliseconds to wait for a lock before failing
+}
+
+DB_SETTING_CHOICES = {
+    "auto_vacuum": ("NONE", "FULL", "INCREMENTAL"),
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+}
+
+
+def load_db_settings(config_path=None, environ=None):
+    """Build the connection settings from the defaults, a config file and environment variables.
+
+    The config file is an INI file with a [database] section (default
+    library.ini, or the path in LIBRARY_DB_CONFIG). Environment variables
+    named LIBRARY_DB_<SETTING>, e.g. LIBRARY_DB_JOURNAL_MODE, override it.
+    Raises ValueError for unknown settings or invalid values.
+    """
+    environ = os.environ if environ is None else environ
+    settings = dict(DEFAULT_DB_SETTINGS)
+
+    config_path = config_path or environ.get("LIBRARY_DB_CONFIG", "library.ini")
+    parser = configparser.ConfigParser()
+    if parser.read(config_path) and parser.has_section("database"):
+        for name, value in parser.items("database"):
+            if name not in settings:
+                raise ValueError(f"Unknown database setting '{name}' in {config_path}")
+            settings[name] = value
+
+    for name in settings:
+        value = environ.get(f"LIBRARY_DB_{name.upper()}")
+        if value is not None:
+            settings[name] = value
+
+    # PRAGMA values can't be bound as parameters, so validate them strictly
+    for name, value in settings.items():
+        if name in DB_SETTING_CHOICES:
+            value = str(value).strip().upper()
+            if value not in DB_SETTING_CHOICES[name]:
+                raise ValueError(f"Invalid value for {name}: {value}")
+        else:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"{name} must be an integer, not {value!r}")
+        settings[name] = value
+    return settings
+
+# Versioned schema: SCHEMA_MIGRATIONS[n] upgrades a database from PRAGMA
+# user_version n to n + 1. Existing library.db files (user_version 0 with the
+# Books table already present) are upgraded in place; append new migrations,
+# never edit old ones.
+SCHEMA_MIGRATIONS = [
+    # 1: the original Books table
+    [
+        """
+        CREATE TABLE IF NOT EXISTS Books (
+            BookID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Title TEXT NOT NULL,
+            Author TEXT NOT NULL,
+            Year INTEGER NOT NULL,
+            Status TEXT NOT NULL CHECK (Status IN ('Available', 'Checked Out'))
+        )
+        """,
+    ],
+    # 2: secondary indexes. Each one ends in the implicit rowid (BookID), so it
+    # covers lookups, counts and (key, BookID) keyset ordering on its column.
+    [
+        "CREATE INDEX IF NOT EXISTS idx_books_author ON Books (Author COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_books_year ON Books (Year)",
+        "CREATE INDEX IF NOT EXISTS idx_books_status ON Books (Status)",
+        "CREATE INDEX IF NOT EXISTS idx_books_title_nocase ON Books (Title COLLATE NOCASE)",
+    ],
+    # 3: circulation. Loans keeps the history of every check-out; timestamps
+    # are UTC 'YYYY-MM-DD HH:MM:SS' text, which sorts chronologically. The
+    # partial indexes only hold open loans, so "currently out" and "overdue"
+    # stay small however long the history grows, and the unique one forbids
+    # two open loans of the same copy. BookLoanCounts is kept up to date by
+    # a trigger so "most borrowed" is an index scan instead of a GROUP BY.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS Loans (
+            LoanID INTEGER PRIMARY KEY AUTOINCREMENT,
+            BookID INTEGER NOT NULL,
+            Borrower TEXT NOT NULL,
+            CheckedOutAt TEXT NOT NULL,
+            DueAt TEXT NOT NULL,
+            ReturnedAt TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_loans_book ON Loans (BookID, CheckedOutAt)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_loans_open_book ON Loans (BookID) WHERE ReturnedAt IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_loans_open_due ON Loans (DueAt) WHERE ReturnedAt IS NULL",
+        """
+        CREATE TABLE IF NOT EXISTS BookLoanCounts (
+            BookID INTEGER PRIMARY KEY,
+            LoanCount INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_loan_counts ON BookLoanCounts (LoanCount)",
+        """
+        CREATE TRIGGER IF NOT EXISTS Loans_count_insert AFTER INSERT ON Loans BEGIN
+            INSERT INTO BookLoanCounts (BookID, LoanCount) VALUES (new.BookID, 1)
+            ON CONFLICT (BookID) DO UPDATE SET LoanCount = LoanCount + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS Books_loans_delete AFTER DELETE ON Books BEGIN
+            DELETE FROM Loans WHERE BookID = old.BookID;
+            DELETE FROM BookLoanCounts WHERE BookID = old.BookID;
+        END
+        """,
+        # Books already checked out get an open loan with an unknown borrower
+        """
+        INSERT INTO Loans (BookID, Borrower, CheckedOutAt, DueAt)
+        SELECT BookID, 'Unknown', datetime('now'), datetime('now', '+14 days')
+        FROM Books WHERE Status = 'Checked Out'
+        """,
+    ],
+    # 4: normalized Title/Author and the duplicate-detection blocking key. They
+    # are computed in Python (see book_keys); connect() registers the same
+    # functions in SQL so existing rows can be backfilled here.
+    [
+        "ALTER TABLE Books ADD COLUMN TitleNorm TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE Books ADD COLUMN AuthorNorm TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE Books ADD COLUMN DedupeKey TEXT NOT NULL DEFAULT ''",
+        "UPDATE Books SET TitleNorm = normalize_title(Title), AuthorNorm = normalize_author(Author), "
+        "DedupeKey = dedupe_key(Title, Author)",
+        "CREATE INDEX IF NOT EXISTS idx_books_author_norm ON Books (AuthorNorm, Year)",
+        "CREATE INDEX IF NOT EXISTS idx_books_dedupe ON Books (DedupeKey, Year)",
+    ],
+    # 5: change feed. Every committed insert, update or delete of a book
+    # appends its BookID to BookChanges under the next sequence number
+    # (AUTOINCREMENT, so numbers are never reused), and other connections
+    # replay just those rows instead of re-reading the catalogue.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS BookChanges (
+            Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            BookID INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS Books_changes_insert AFTER INSERT ON Books BEGIN
+            INSERT INTO BookChanges (BookID) VALUES (new.BookID);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS Books_changes_update AFTER UPDATE OF Title, Author, Year, Status ON Books BEGIN
+            INSERT INTO BookChanges (BookID) VALUES (new.BookID);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS Books_changes_delete AFTER DELETE ON Books BEGIN
+            INSERT INTO BookChanges (BookID) VALUES (old.BookID);
+        END
+        """,
+    ],
+    # 6: facet counts for the statistics panel. Like BookLoanCounts they are
+    # kept up to date by triggers, so the unfiltered counts by Status, decade
+    # and author are index lookups instead of GROUP BYs over every book.
+    # Value is the Status, the decade (Year / 10 * 10) or the AuthorNorm.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS BookFacetCounts (
+            Facet TEXT NOT NULL,
+            Value NOT NULL,
+            Books INTEGER NOT NULL,
+            PRIMARY KEY (Facet, Value)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_facet_counts ON BookFacetCounts (Facet, Books)",
+        """
+        CREATE TRIGGER IF NOT EXISTS Books_facets_insert AFTER INSERT ON Books BEGIN
+            INSERT INTO BookFacetCounts (Facet, Value, Books)
+            VALUES ('Status', new.Status, 1), ('Decade', new.Year / 10 * 10, 1), ('Author', new.AuthorNorm, 1)
+            ON CONFLICT (Facet, Value) DO UPDATE SET Books = Books + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS Books_facets_delete AFTER DELETE ON Books BEGIN
+            UPDATE BookFacetCounts SET Books = Books - 1
+            WHERE (Facet = 'Status' AND Value = old.Status) OR (Facet = 'Decade' AND Value = old.Year / 10 * 10)
+               OR (Facet = 'Author' AND Value = old.AuthorNorm);
+            DELETE FROM BookFacetCounts
+            WHERE Books = 0 AND ((Facet = 'Status' AND Value = old.Status) OR (Facet = 'Decade' AND Value = old.Year / 10 * 10)
+               OR (Facet = 'Author' AND Value = old.AuthorNorm));
+        END
+        """,
+        # Only the facets whose value actually changed are moved
+        """
+        CREATE TRIGGER IF NOT EXISTS Books_facets_update AFTER UPDATE OF Status, Year, AuthorNorm ON Books BEGIN
+            INSERT INTO BookFacetCounts (Facet, Value, Books)
+            SELECT 'Status', new.Status, 1 WHERE new.Status IS NOT old.Status
+            UNION ALL SELECT 'Decade', new.Year / 10 * 10, 1 WHERE new.Year / 10 * 10 IS NOT old.Year / 10 * 10
+            UNION ALL SELECT 'Author', new.AuthorNorm, 1 WHERE new.AuthorNorm IS NOT old.AuthorNorm
+            ON CONFLICT (Facet, Value) DO UPDATE SET Books = Books + 1;
+            UPDATE BookFacetCounts SET Books = Books - 1
+            WHERE (Facet = 'Status' AND Value = old.Status AND new.Status IS NOT old.Status)
+               OR (Facet = 'Decade' AND Value = old.Year / 10 * 10 AND new.Year / 10 * 10 IS NOT old.Year / 10 * 10)
+               OR (Facet = 'Author' AND Value = old.AuthorNorm AND new.AuthorNorm IS NOT old.AuthorNorm);
+            DELETE FROM BookFacetCounts
+            WHERE Books = 0 AND ((Facet = 'Status' AND Value = old.Status) OR (Facet = 'Decade' AND Value = old.Year / 10 * 10)
+               OR (Facet = 'Author' AND Value = old.AuthorNorm));
+        END
+        """,
+        """
+        INSERT INTO BookFacetCounts (Facet, Value, Books)
+        SELECT 'Status', Status, COUNT(*) FROM Books GROUP BY Status
+        UNION ALL SELECT 'Decade', Year / 10 * 10, COUNT(*) FROM Books GROUP BY Year / 10 * 10
+        UNION ALL SELECT 'Author', AuthorNorm, COUNT(*) FROM Books GROUP BY AuthorNorm
+        """,
+    ],
+]
+SCHEMA_VERSION = len(SCHEMA_MIGRATIONS)
+BOOK_FIELDS = "BookID, Title, Author, Year, Status"  # A book row, in the order the code unpacks it
+
+# Fixed SQL that check_query_plans shares with the methods that run it, so the
+# checked statements can't drift from the issued ones
+CHANGES_SINCE_SQL = "SELECT Seq, BookID FROM BookChanges WHERE Seq > ? ORDER BY Seq"
+DUPLICATE_CANDIDATE = "(DedupeKey = ? AND Year = ?) OR (AuthorNorm = ? AND Year = ?)"
+DUPLICATE_CANDIDATES_SQL = f"SELECT {BOOK_FIELDS}, TitleNorm, AuthorNorm, DedupeKey FROM Books WHERE {{condition}}"
+OPEN_LOAN_SQL = "SELECT 1 FROM Loans WHERE BookID = ? AND ReturnedAt IS NULL"
+CLOSE_LOAN_SQL = """
+    UPDATE Loans
+    SET ReturnedAt = ?
+    WHERE BookID = ? AND ReturnedAt IS NULL
+"""
+OPEN_LOANS_SQL = """
+    SELECT Loans.LoanID, Loans.BookID, Books.Title, Loans.Borrower, Loans.CheckedOutAt, Loans.DueAt
+    FROM Loans JOIN Books ON Books.BookID = Loans.BookID
+    WHERE Loans.ReturnedAt IS NULL {condition}
+    ORDER BY Loans.DueAt
+    LIMIT ?
+"""
+MOST_BORROWED_SQL = """
+    SELECT Books.BookID, Books.Title, Books.Author, BookLoanCounts.LoanCount
+    FROM BookLoanCounts JOIN Books ON Books.BookID = BookLoanCounts.BookID
+    ORDER BY BookLoanCounts.LoanCount DESC
+    LIMIT ?
+"""
+LOAN_HISTORY_SQL = """
+    SELECT LoanID, Borrower, CheckedOutAt, DueAt, ReturnedAt
+    FROM Loans
+    WHERE BookID = ?
+    ORDER BY CheckedOutAt DESC
+"""
+
+# SQL sort keys for the GUI columns. The NOCASE keys match the title and
+# author indexes. Status needs no CASE expression for its custom order:
+# the CHECK constraint only allows 'Available' and 'Checked Out', which
+# already sort that way, so idx_books_status can serve the ORDER BY.
+SORT_COLUMNS = ("ID", "Title", "Author", "Year", "Status")
+NOCASE_FOLD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")  # Python equivalent of COLLATE NOCASE
+SORT_EXPRESSIONS = {
+    "ID": "BookID",
+    "Title": "Title COLLATE NOCASE",
+    "Author": "Author COLLATE NOCASE",
+    "Year": "Year",
+    "Status": "Status",
+}
+
+# Facets for filtering and the statistics panel. A facet filter is a sorted
+# tuple of (facet, value) pairs such as (("Decade", 1950), ("Status",
+# "Available")), so it can be part of a cache key; Author values are AuthorNorm.
+FACET_NAMES = ("Status", "Decade", "Author")
+FACET_GROUPS = {"Status": "Status", "Decade": "Year / 10 * 10", "Author": "AuthorNorm"}
+
+
+def facet_condition(facet, value):
+    """Return the SQL condition and parameters that restrict Books to one facet value."""
+    if facet == "Status":
+        return "Status = ?", [value]
+    if facet == "Decade":
+        return "Year BETWEEN ? AND ?", [value, value + 9]  # A range, so idx_books_year can be used
+    if facet == "Author":
+        return "AuthorNorm = ?", [value]
+    raise ValueError(f"Unknown facet: {facet}")
+
+
+def facet_value(facet, book):
+    """Return a book row's value for a facet, as BookFacetCounts groups it."""
+    if facet == "Status":
+        return book[4]
+    if facet == "Decade":
+        return book[3] // 10 * 10
+    if facet == "Author":
+        return normalize_author(book[2])
+    raise ValueError(f"Unknown facet: {facet}")
+
+
+class CheckoutConflict(Exception):
+    """Raised when a book is checked out or in but its status has already changed."""
+    def __init__(self, book_id, status):
+        super().__init__(f"Book ID {book_id} is already {status.lower()}.")
+        self.book_id = book_id
+        self.status = status
+
+
+def utc_timestamp(moment=None):
+    """Format a datetime (default: now) as the UTC text timestamps stored in Loans."""
+    moment = moment or datetime.now(timezone.utc)
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+# Normalization and duplicate detection. Every book stores normalized
+# copies of its Title and Author (case, diacritics, punctuation and spacing
+# folded; "Last, First" authors turned around) plus a blocking key, so
+# near-duplicates are only ever compared with the few books sharing a block.
+TITLE_ARTICLES = ("the", "a", "an")
+DUPLICATE_THRESHOLD = 0.9  # Minimum difflib similarity of both titles and authors
+
+
+def normalize_text(text):
+    """Fold case, diacritics, punctuation and spacing: ' Café  Society! ' -> 'cafe society'."""
+    folded = "".join(c for c in unicodedata.normalize("NFKD", str(text)) if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[^\W_]+", folded.casefold()))
+
+
+def normalize_title(title):
+    """Normalize a title for matching and duplicate detection."""
+    return normalize_text(title)
+
+
+@functools.lru_cache(maxsize=65536)  # Authors repeat a lot during imports
+def normalize_author(author):
+    """Normalize an author name, reading 'Tolkien, J.R.R.' as 'J.R.R. Tolkien'."""
+    parts = [part.strip() for part in str(author).split(",")]
+    if len(parts) == 2 and all(parts):
+        author = f"{parts[1]} {parts[0]}"
+    return normalize_text(author)
+
+
+def book_keys(title, author):
+    """Return (TitleNorm, AuthorNorm, DedupeKey) for a book.
+
+    The blocking key is the author's surname plus the first three letters of
+    the first significant title word, e.g. 'tolkien|hob' for The Hobbit.
+    """
+    title_norm = normalize_title(title)
+    author_norm = normalize_author(author)
+    words = strip_article(title_norm).split()
+    surname = author_norm.rsplit(" ", 1)[-1]
+    return title_norm, author_norm, f"{surname}|{words[0][:3] if words else ''}"
+
+
+def strip_article(title_norm):
+    """Drop a leading 'the', 'a' or 'an' from a normalized title."""
+    first, _, rest = title_norm.partition(" ")
+    return rest if rest and first in TITLE_ARTICLES else title_norm
+
+
+def dedupe_key(title, author):
+    """The DedupeKey of a book; also registered as an SQL function for the schema migration."""
+    return book_keys(title, author)[2]
+
+
+def similar_books(a, b, threshold=DUPLICATE_THRESHOLD):
+    """Check whether two (TitleNorm, AuthorNorm, Year) triples look like the same book."""
+    if a[2] != b[2]:
+        return False
+    for x, y in ((strip_article(a[0]), strip_article(b[0])), (a[1], b[1])):
+        if x != y:
+            matcher = difflib.SequenceMatcher(None, x, y)
+            if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold or matcher.ratio() < threshold:
+                return False
+    return True
+
+
+class DuplicateBook(Exception):
+    """Raised when a book being added looks like one already in the catalogue."""
+    def __init__(self, matches):
+        super().__init__("Possible duplicate of " + ", ".join(
+            f"Book ID {book[0]} ('{book[1]}' by {book[2]}, {book[3]})" for book in matches) + ".")
+        self.matches = matches
+
+
+class DuplicateIndex:
+    """In-memory blocks of books for near-duplicate matching.
+
+    Each book is filed under (DedupeKey, Year) and (AuthorNorm, Year), and a
+    lookup only compares against the books in those two blocks.
+    """
+    def __init__(self):
+        self.blocks = {}
+
+    def add(self, keys, year, item):
+        """File item (e.g. a book row) under its (TitleNorm, AuthorNorm, DedupeKey) keys."""
+        title_norm, author_norm, key = keys
+        entry = ((title_norm, author_norm, year), item)
+        self.blocks.setdefault(("key", key, year), []).append(entry)
+        self.blocks.setdefault(("author", author_norm, year), []).append(entry)
+
+    def matches(self, keys, year):
+        """Return the items that look like duplicates of a book, in the order they were added."""
+        title_norm, author_norm, key = keys
+        triple = (title_norm, author_norm, year)
+        found = []
+        for block in (("key", key, year), ("author", author_norm, year)):
+            for other, item in self.blocks.get(block, ()):
+                if item not in found and similar_books(triple, other):
+                    found.append(item)
+        return found
+
+# Query instrumentation. It is only installed when a QueryMetrics is passed to
+# LibraryDatabase; otherwise the connection uses the plain sqlite3 classes and
+# the @timed methods pay for a single attribute check.
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+EXPLAINABLE = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b", re.IGNORECASE)
+
+
+class LatencyHistogram:
+    """Call count, rows returned and a bucketed latency distribution for one method or statement."""
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.total = 0.0
+        self.fetch = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)  # The last bucket is everything slower
+
+    def record(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def percentile(self, fraction):
+        """Estimate a latency percentile in ms as the upper bound of the bucket it falls in."""
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max * 1000)
+        return self.max * 1000
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "rows": self.rows,
+            "total_ms": round(self.total * 1000, 3),
+            "fetch_ms": round(self.fetch * 1000, 3),
+            "mean_ms": round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            "p50_ms": round(self.percentile(0.5), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max * 1000, 3),
+            "buckets": {f"le_{bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS + ("inf",), self.buckets)},
+        }
+
+
+class QueryMetrics:
+    """Thread-safe latency counters shared by every connection they are passed to.
+
+    Methods decorated with @timed are recorded by name and SQL statements by
+    their text (whitespace collapsed). Statement latency is the execute()
+    call, which steps to the first row; time spent in the fetch calls and the
+    rows they return are counted separately. Statements slower than
+    slow_query_ms are logged together with their EXPLAIN QUERY PLAN.
+    """
+    max_statements = 500  # Distinct statements tracked before the rest are lumped together
+
+    def __init__(self, slow_query_ms=None, log=None, keep_slow=50):
+        self.slow_query_ms = slow_query_ms
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.keep_slow = keep_slow
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Discard everything recorded so far."""
+        with self.lock:
+            self.started = time.time()
+            self.methods = {}
+            self.statements = {}
+            self.keys = {}
+            self.plans = {}
+            self.slow_queries = deque(maxlen=self.keep_slow)
+
+    def statement_key(self, sql):
+        key = self.keys.get(sql)
+        if key is None:
+            key = " ".join(sql.split())
+            if len(self.keys) < self.max_statements * 4:
+                self.keys[sql] = key
+        return key
+
+    def histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            if table is self.statements and len(table) >= self.max_statements:
+                key = "<other>"
+                histogram = table.get(key)
+            if histogram is None:
+                histogram = table[key] = LatencyHistogram()
+        return histogram
+
+    def record_method(self, name, seconds):
+        with self.lock:
+            self.histogram(self.methods, name).record(seconds)
+
+    def record_statement(self, sql, seconds):
+        """Record one execute() and return True if it was slow enough to log."""
+        with self.lock:
+            self.histogram(self.statements, self.statement_key(sql)).record(seconds)
+        return self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms
+
+    def record_rows(self, sql, rows, seconds):
+        with self.lock:
+            histogram = self.histogram(self.statements, self.statement_key(sql))
+            histogram.rows += rows
+            histogram.fetch += seconds
+
+    def record_slow(self, sql, seconds, plan_func):
+        """Log a slow statement with its query plan, which is looked up once per statement."""
+        key = self.statement_key(sql)
+        with self.lock:
+            plan = self.plans.get(key)
+        if plan is None:
+            plan = plan_func() if EXPLAINABLE.match(sql) else ""
+            with self.lock:
+                self.plans[key] = plan
+        entry = {"at": utc_timestamp(), "ms": round(seconds * 1000, 3), "sql": key, "plan": plan}
+        with self.lock:
+            self.slow_queries.append(entry)
+        self.log(f"Slow query ({entry['ms']} ms): {key}" + (f"\n  Plan: {plan}" if plan else ""))
+
+    def snapshot(self):
+        """Return the counters as a JSON-ready dict."""
+        with self.lock:
+            return {
+                "since": datetime.fromtimestamp(self.started, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "slow_query_ms": self.slow_query_ms,
+                "methods": {name: h.as_dict() for name, h in sorted(self.methods.items())},
+                "statements": {sql: h.as_dict() for sql, h in sorted(self.statements.items())},
+                "commit": self.statements["COMMIT"].as_dict() if "COMMIT" in self.statements else None,
+                "slow_queries": list(self.slow_queries),
+            }
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch timings to its connection's QueryMetrics."""
+    sql = None
+
+    def execute(self, sql, parameters=()):
+        metrics = self.connection.metrics
+        start = time.perf_counter()
+        result = super().execute(sql, parameters)
+        elapsed = time.perf_counter() - start
+        self.sql = sql
+        if metrics.record_statement(sql, elapsed):
+            metrics.record_slow(sql, elapsed, lambda: self.connection.explain(sql, parameters))
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        metrics = self.connection.metrics
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        elapsed = time.perf_counter() - start
+        self.sql = sql
+        if metrics.record_statement(sql, elapsed):
+            metrics.record_slow(sql, elapsed, lambda: "")  # The parameters may have been a one-shot iterator
+        return result
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.connection.metrics.record_rows(self.sql or "", row is not None, time.perf_counter() - start)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.connection.metrics.record_rows(self.sql or "", len(rows), time.perf_counter() - start)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.connection.metrics.record_rows(self.sql or "", len(rows), time.perf_counter() - start)
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors are InstrumentedCursors reporting to self.metrics."""
+    metrics = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def explain(self, sql, parameters=()):
+        """Return the EXPLAIN QUERY PLAN of a statement, on an uninstrumented cursor."""
+        cursor = sqlite3.Cursor(self)
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            return "; ".join(row[-1] for row in cursor.fetchall())
+        except sqlite3.Error as e:
+            return f"(unavailable: {e})"
+        finally:
+            cursor.close()
+
+
+def timed(method):
+    """Record a LibraryDatabase method's latency in self.metrics when instrumentation is on."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            metrics.record_method(name, time.perf_counter() - start)
+    return wrapper
+
+# In-memory catalogue mirror
+MIRROR_SORT_COLUMNS = ("ID", "Title", "Author", "Year", "Status")
+
+
+class CatalogueMirror:
+    """A compact in-process copy of the Books table for counts, sorts and paging without SQL.
+
+    Columns are stored separately: BookID and Year in array('q'), Status as a
+    flag per row (1 = Checked Out) and Title/Author as pooled strings, each
+    with a precomputed folded sort key (like COLLATE NOCASE) and its
+    normalized form for substring matching (like the LIKE filter on
+    TitleNorm/AuthorNorm). Status flags are a bytearray with one byte
+    per row rather than packed bits, so bytes.count and slicing scan them in
+    C. Rows stay in BookID order; deleted rows are only flagged dead, and
+    compacted away once they pile up. The sort order for a column is built
+    on first use and then kept up to date row by row.
+
+    Memory use (see memory_bytes) is capped at max_bytes: a mirror that
+    would grow past the cap drops its contents and records why in disabled,
+    and the database answers from SQL instead.
+    """
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.disabled = None  # Why the mirror was dropped, if it was
+        self.clear()
+
+    def clear(self):
+        """Discard all rows and derived indexes."""
+        self.loaded = False
+        self.ids = array("q")
+        self.years = array("q")
+        self.checked_out = bytearray()
+        self.live = bytearray()
+        self.titles = []
+        self.authors = []
+        self.title_keys = []
+        self.author_keys = []
+        self.title_norms = []
+        self.author_norms = []
+        self.strings = {}  # Pool of distinct strings, so repeated authors and keys are stored once
+        self.string_bytes = 0
+        self.dead = 0
+        self.checked_out_count = 0
+        self.orders = {}  # Sort column -> array of row indices in (key, BookID) order
+        self.search_index = None  # (title blob, title starts, author blob, author starts)
+        self.last_filter = None  # ((title, author), matching row indices)
+
+    def intern(self, text):
+        pooled = self.strings.get(text)
+        if pooled is None:
+            pooled = self.strings[text] = text
+            self.string_bytes += sys.getsizeof(text)
+        return pooled
+
+    def load(self, batches):
+        """Replace the contents with batches of Books rows in BookID order; returns False if over the cap."""
+        self.clear()
+        self.disabled = None
+        for rows in batches:
+            for book in rows:
+                self.append(book)
+            if not self.check_memory():
+                return False
+        self.loaded = True
+        return True
+
+    def memory_bytes(self):
+        """Estimate the memory held by the mirror, including its pooled strings and indexes."""
+        total = sum(column.itemsize * len(column) for column in (self.ids, self.years, *self.orders.values()))
+        total += len(self.checked_out) + len(self.live) + self.string_bytes + sys.getsizeof(self.strings)
+        total += sum(sys.getsizeof(column) for column in (self.titles, self.authors, self.title_keys, self.author_keys,
+                                                          self.title_norms, self.author_norms))
+        if self.search_index is not None:
+            total += sum(sys.getsizeof(part) if isinstance(part, str) else part.itemsize * len(part)
+                         for part in self.search_index)
+        return total
+
+    def check_memory(self):
+        """Drop the mirror if it has grown past max_bytes; returns whether it is still usable."""
+        size = self.memory_bytes()
+        if size > self.max_bytes:
+            self.clear()
+            self.disabled = f"needs more than {self.max_bytes / (1 << 20):.0f} MiB (reached {size / (1 << 20):.0f} MiB)"
+            return False
+        return True
+
+    def stats(self):
+        """Return the row counts and memory use as a dict."""
+        return {
+            "loaded": self.loaded,
+            "rows": len(self.ids) - self.dead,
+            "checked_out": self.checked_out_count,
+            "dead_rows": self.dead,
+            "bytes": self.memory_bytes(),
+            "max_bytes": self.max_bytes,
+            "disabled": self.disabled,
+        }
+
+    @staticmethod
+    def norms(book):
+        """The (TitleNorm, AuthorNorm) of a row, read from the row when it carries them."""
+        return book[5:7] if len(book) >= 7 else (normalize_title(book[1]), normalize_author(book[2]))
+
+    def append(self, book):
+        book_id, title, author, year, status = book[:5]
+        title_norm, author_norm = self.norms(book)
+        flag = status == "Checked Out"
+        self.ids.append(book_id)
+        self.years.append(year)
+        self.checked_out.append(flag)
+        self.live.append(1)
+        self.checked_out_count += flag
+        self.titles.append(self.intern(title))
+        self.authors.append(self.intern(author))
+        self.title_keys.append(self.intern(title.translate(NOCASE_FOLD)))
+        self.author_keys.append(self.intern(author.translate(NOCASE_FOLD)))
+        self.title_norms.append(self.intern(title_norm))
+        self.author_norms.append(self.intern(author_norm))
+
+    def row(self, index):
+        """Rebuild the Books row stored at index."""
+        return (self.ids[index], self.titles[index], self.authors[index], self.years[index],
+                "Checked Out" if self.checked_out[index] else "Available")
+
+    def position(self, book_id):
+        """Return the row index of a BookID (live or dead), or None."""
+        index = bisect.bisect_left(self.ids, book_id)
+        if index < len(self.ids) and self.ids[index] == book_id:
+            return index
+        return None
+
+    def key_function(self, col):
+        """Return index -> (key, BookID), the mirror's version of SORT_EXPRESSIONS."""
+        ids = self.ids
+        if col == "ID":
+            return ids.__getitem__
+        keys = {"Title": self.title_keys, "Author": self.author_keys,
+                "Year": self.years, "Status": self.checked_out}[col]
+        return lambda index: (keys[index], ids[index])
+
+    @staticmethod
+    def row_key(col, book):
+        """The key_function value for a Books row given as a tuple."""
+        if col == "ID":
+            return book[0]
+        value = book[MIRROR_SORT_COLUMNS.index(col)]
+        if col in ("Title", "Author"):
+            value = value.translate(NOCASE_FOLD)
+        elif col == "Status":
+            value = int(value == "Checked Out")
+        return (value, book[0])
+
+    def order(self, col):
+        """Return the row indices sorted by a column, building them on first use."""
+        if col == "ID":
+            return range(len(self.ids))
+        order = self.orders.get(col)
+        if order is None:
+            # Rows are in BookID order and sorted() is stable, so ties stay in BookID order
+            keys = self.key_function(col)
+            order = self.orders[col] = array("q", sorted(range(len(self.ids)), key=keys))
+        return order
+
+    def apply(self, book_id, book):
+        """Bring one BookID up to date with its Books row (None if deleted).
+
+        Returns False if the change can't be applied in place (a new BookID
+        lower than existing ones), in which case the mirror must be reloaded.
+        """
+        index = self.position(book_id)
+        if index is None:
+            if book is None:
+                return True
+            if self.ids and book_id < self.ids[-1]:
+                return False
+            index = len(self.ids)
+            self.append(book)
+            for col, order in self.orders.items():
+                key = self.key_function(col)
+                order.insert(bisect.bisect_left(order, key(index), key=key), index)
+            self.search_index = self.last_filter = None
+            return True
+
+        if book is None:
+            if self.live[index]:
+                self.live[index] = 0
+                self.dead += 1
+                self.checked_out_count -= self.checked_out[index]
+                if self.dead > 1000 and self.dead * 4 > len(self.ids):
+                    self.compact()
+            return True
+
+        # Take the row out of the sort orders under its old keys and put it back under the new ones
+        for col, order in self.orders.items():
+            key = self.key_function(col)
+            position = bisect.bisect_left(order, key(index), key=key)
+            del order[position]
+        if self.live[index]:
+            self.checked_out_count -= self.checked_out[index]
+        else:
+            self.live[index] = 1
+            self.dead -= 1
+        _, title, author, year, status = book[:5]
+        if title != self.titles[index] or author != self.authors[index]:
+            title_norm, author_norm = self.norms(book)
+            self.titles[index] = self.intern(title)
+            self.authors[index] = self.intern(author)
+            self.title_keys[index] = self.intern(title.translate(NOCASE_FOLD))
+            self.author_keys[index] = self.intern(author.translate(NOCASE_FOLD))
+            self.title_norms[index] = self.intern(title_norm)
+            self.author_norms[index] = self.intern(author_norm)
+            self.search_index = self.last_filter = None
+        self.years[index] = year
+        self.checked_out[index] = status == "Checked Out"
+        self.checked_out_count += self.checked_out[index]
+        for col, order in self.orders.items():
+            key = self.key_function(col)
+            order.insert(bisect.bisect_left(order, key(index), key=key), index)
+        return True
+
+    def compact(self):
+        """Rebuild the columns without the dead rows."""
+        rows = [self.row(index) + (self.title_norms[index], self.author_norms[index])
+                for index in range(len(self.ids)) if self.live[index]]
+        self.load([rows])
+
+    def matching_rows(self, title="", author=""):
+        """Return the row indices whose normalized Title/Author contain title/author, as filter_clause matches.
+
+        Each column's normalized values are joined into one string, so the
+        scan is a series of str.find calls; the result is None when there is
+        no filter.
+        """
+        if not title and not author:
+            return None
+        if self.last_filter is not None and self.last_filter[0] == (title, author):
+            return self.last_filter[1]
+        if self.search_index is None:
+            self.search_index = self.build_search_index(self.title_norms) + self.build_search_index(self.author_norms)
+        title_blob, title_starts, author_blob, author_starts = self.search_index
+        rows = None
+        for text, blob, starts, normalize in ((title, title_blob, title_starts, normalize_title),
+                                              (author, author_blob, author_starts, normalize_author)):
+            if text:
+                found = self.find_rows(blob, starts, normalize(text))
+                rows = found if rows is None else sorted(set(rows).intersection(found))
+        self.last_filter = ((title, author), rows)
+        return rows
+
+    @staticmethod
+    def build_search_index(keys):
+        """Join values with NUL separators and record where each one starts."""
+        starts = array("q", itertools.accumulate(map(len, keys), lambda offset, length: offset + length + 1, initial=0))
+        return "\0".join(keys), starts
+
+    @staticmethod
+    def find_rows(blob, starts, needle):
+        rows = []
+        last = len(starts) - 2
+        offset = blob.find(needle)
+        while offset != -1:
+            index = bisect.bisect_right(starts, offset) - 1
+            rows.append(index)
+            if index == last:
+                break
+            offset = blob.find(needle, starts[index + 1])
+        return rows
+
+    def count(self, title="", author="", status=None):
+        """Count the live books matching a substring filter and optional status."""
+        rows = self.matching_rows(title, author)
+        if rows is None:
+            total = len(self.ids) - self.dead
+            if status is None:
+                return total
+            return self.checked_out_count if status == "Checked Out" else total - self.checked_out_count
+        flag = None if status is None else status == "Checked Out"
+        live, checked_out = self.live, self.checked_out
+        return sum(1 for index in rows if live[index] and (flag is None or checked_out[index] == flag))
+
+    def page(self, title="", author="", sort=None, after=None, before=None, limit=100, status=None):
+        """Return rows exactly as LibraryDatabase.get_books_page would without FTS.
+
+        A limit of None returns every matching row. Returns None if building
+        the sort order pushed the mirror over its memory cap.
+        """
+        col, descending = sort if sort else ("ID", False)
+        if col not in MIRROR_SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {col}")
+        key = self.key_function(col)
+        rows = self.matching_rows(title, author)
+        wanted = None
+        if rows is not None and (col == "ID" or len(rows) * 8 < len(self.ids)):
+            # Few matches: sorting them directly beats walking the full sort order
+            sequence = rows if col == "ID" else sorted(rows, key=key)
+        else:
+            sequence = self.order(col)
+            if not self.check_memory():
+                return None
+            wanted = None if rows is None else set(rows)
+
+        boundary = after if after is not None else before
+        forwards = before is None
+        if forwards != descending:
+            if boundary is not None:
+                sequence = sequence[bisect.bisect_right(sequence, self.row_key(col, boundary), key=key):]
+            indices = iter(sequence)
+        else:
+            if boundary is not None:
+                sequence = sequence[:bisect.bisect_left(sequence, self.row_key(col, boundary), key=key)]
+            indices = reversed(sequence)
+
+        flag = None if status is None else status == "Checked Out"
+        live, checked_out = self.live, self.checked_out
+        page = []
+        for index in indices:
+            if live[index] and (wanted is None or index in wanted) and (flag is None or checked_out[index] == flag):
+                page.append(self.row(index))
+                if len(page) == limit:
+                    break
+        return page if forwards else page[::-1]
+
+
 # Database handler class
 class LibraryDatabase:
-    def __init__(self, db_name="library.db"):
+    max_external_changes = 1000  # Past this many changed books, poll_changes asks for a full reload
+
+    def __init__(self, db_name="library.db", use_fts=True, settings=None, check_same_thread=True, metrics=None,
+                 mirror_max_bytes=None):
         self.db_name = db_name
+        self.use_fts = use_fts
+        self.check_same_thread = check_same_thread
+        self.settings = load_db_settings() if settings is None else settings
+        self.metrics = metrics  # A QueryMetrics to record timings in, or None for no instrumentation
+        self.fts_enabled = False
         self.conn = None
         self.cursor = None
+        self.transaction_depth = 0
+        self.generation = 0  # Bumped on every committed write; invalidates cached results
+        # Optional in-memory copy of Books, loaded by load_mirror and kept in step by our own commits
+        self.mirror = None if mirror_max_bytes is None else CatalogueMirror(mirror_max_bytes)
+        self.mirror_dirty = set()  # BookIDs written in the open transaction
+        # Change feed position: the PRAGMA data_version and BookChanges.Seq seen at the last poll
+        self.data_version = None
+        self.change_seq = 0
+        self.external_changes = set()  # BookIDs changed by other connections, until taken; None if too many
+        self.facet_cache = {}  # facet_counts results, valid while facet_cache_version is current
+        self.facet_cache_version = None
         self.connect()
         self.create_table()
+        self.data_version, self.change_seq = self.change_state()
+
+    def connect(self):
+        """Connect to the SQLite database.
+
+        The connection runs in autocommit mode; writes are grouped explicitly
+        with transaction(). The performance profile in self.settings is
+        applied as PRAGMAs. With self.metrics set, every statement is timed.
+        """
+        busy_timeout = self.settings.get("busy_timeout", DEFAULT_DB_SETTINGS["busy_timeout"])
+        factory = sqlite3.Connection if self.metrics is None else InstrumentedConnection
+        self.conn = sqlite3.connect(self.db_name, isolation_level=None, timeout=busy_timeout / 1000,
+                                    check_same_thread=self.check_same_thread, factory=factory)
+        if self.metrics is not None:
+            self.conn.metrics = self.metrics
+        self.conn.create_function("normalize_title", 1, normalize_title, deterministic=True)
+        self.conn.create_function("normalize_author", 1, normalize_author, deterministic=True)
+        self.conn.create_function("dedupe_key", 2, dedupe_key, deterministic=True)
+        self.cursor = self.conn.cursor()
+        for name in ("busy_timeout", "auto_vacuum", "journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store"):
+            if name in self.settings:
+                self.cursor.execute(f"PRAGMA {name} = {self.settings[name]}")
+                self.cursor.fetchall()
+
+    def effective_settings(self):
+        """Read back the PRAGMA values actually in effect on the connection."""
+        values = {}
+        for name in DEFAULT_DB_SETTINGS:
+            self.cursor.execute(f"PRAGMA {name}")
+            row = self.cursor.fetchone()
+            values[name] = row[0] if row else None
+        return values
+
+    @contextmanager
+    def transaction(self):
+        """Group database writes into one atomic unit of work.
+
+        The outermost block runs BEGIN IMMEDIATE ... COMMIT and nested blocks
+        use savepoints, so the mutating methods join whatever transaction is
+        already open and only the outermost block commits. An exception rolls
+        back the block it was raised in and is re-raised.
+
+            with db.transaction():
+                db.update_book(book_id, title, author, year)
+                db.update_status(book_id, status)
+        """
+        depth = self.transaction_depth
+        savepoint = f"sp_{depth}"
+        self.cursor.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT {savepoint}")
+        self.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.transaction_depth = depth
+            if depth == 0:
+                self.mirror_dirty.clear()
+            # SQLite may already have rolled back the whole transaction on errors like an interrupt
+            if self.conn.in_transaction:
+                if depth == 0:
+                    self.cursor.execute("ROLLBACK")
+                else:
+                    self.cursor.execute(f"ROLLBACK TO {savepoint}")
+                    self.cursor.execute(f"RELEASE {savepoint}")
+            raise
+        else:
+            self.transaction_depth = depth
+            if depth > 0:
+                self.cursor.execute(f"RELEASE {savepoint}")
+                return
+            try:
+                self.cursor.execute("COMMIT")
+            except BaseException:
+                # A failed COMMIT (e.g. "database is locked" under a rollback journal while
+                # another connection reads) leaves the transaction open; roll it back so the
+                # connection can still start new transactions
+                self.mirror_dirty.clear()
+                if self.conn.in_transaction:
+                    self.cursor.execute("ROLLBACK")
+                raise
+            self.generation += 1
+            self.skip_own_changes()
+            if self.mirror_dirty:
+                self.sync_mirror()
+
+    def touch(self, *book_ids):
+        """Note BookIDs written in the current transaction, so the mirror can pick them up on commit."""
+        if self.mirror is not None and self.mirror.loaded:
+            self.mirror_dirty.update(book_ids)
+
+    def load_mirror(self):
+        """Load (or reload) the in-memory catalogue mirror and return its stats, or None if disabled."""
+        if self.mirror is None:
+            return None
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT {BOOK_FIELDS}, TitleNorm, AuthorNorm FROM Books ORDER BY BookID")
+            self.mirror.load(iter(lambda: cursor.fetchmany(10000), []))
+        finally:
+            cursor.close()
+        return self.mirror.stats()
+
+    def read_data_version(self):
+        """PRAGMA data_version, which changes when another connection commits to the database."""
+        self.cursor.execute("PRAGMA data_version")
+        return self.cursor.fetchone()[0]
+
+    def sync_mirror(self):
+        """Re-read the rows written by the last commit into the mirror."""
+        dirty = sorted(self.mirror_dirty)
+        self.mirror_dirty.clear()
+        self.refresh_mirror(dirty)
+
+    def refresh_mirror(self, book_ids):
+        """Re-read some books into the loaded mirror, reloading it if they can't be applied in place."""
+        if self.mirror is None or not self.mirror.loaded:
+            return
+        books = self.get_books(book_ids, fields=f"{BOOK_FIELDS}, TitleNorm, AuthorNorm")
+        for book_id in book_ids:
+            if not self.mirror.apply(book_id, books.get(book_id)):
+                self.load_mirror()
+                return
+        self.mirror.check_memory()
+
+    def change_state(self):
+        """Return (PRAGMA data_version, last BookChanges.Seq), read from one snapshot."""
+        self.cursor.execute("SELECT (SELECT data_version FROM pragma_data_version), "
+                            "(SELECT seq FROM sqlite_sequence WHERE name = 'BookChanges')")
+        version, seq = self.cursor.fetchone()
+        return version, seq or 0
+
+    def skip_own_changes(self):
+        """After our own commit, move change_seq past it unless another connection committed since the last poll."""
+        if self.data_version is None:
+            return  # Still migrating the schema in __init__
+        version, seq = self.change_state()
+        if version == self.data_version:
+            self.change_seq = seq
+
+    def poll_changes(self):
+        """Pick up the books other connections have changed since the last poll.
+
+        Costs one PRAGMA data_version when nothing has changed. Otherwise the
+        BookChanges rows after change_seq are replayed: the generation moves
+        on (dropping cached results), the mirror re-reads just those books and
+        their BookIDs are added to external_changes. If the log was pruned
+        past change_seq, or more than max_external_changes books changed,
+        external_changes becomes None, meaning "reload everything".
+        """
+        if self.transaction_depth:
+            return
+        version = self.read_data_version()
+        if version == self.data_version:
+            return
+        self.data_version = version
+        self.cursor.execute(CHANGES_SINCE_SQL, (self.change_seq,))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return  # Only other tables changed, e.g. the loan history
+        self.generation += 1
+        lost = rows[0][0] != self.change_seq + 1
+        self.change_seq = rows[-1][0]
+        book_ids = list(dict.fromkeys(book_id for _, book_id in rows))
+        if lost:
+            self.external_changes = None
+            if self.mirror is not None and self.mirror.loaded:
+                self.load_mirror()
+            return
+        if self.external_changes is not None:
+            self.external_changes.update(book_ids)
+            if len(self.external_changes) > self.max_external_changes:
+                self.external_changes = None
+        self.refresh_mirror(book_ids)
+
+    def take_external_changes(self):
+        """Return and clear the BookIDs collected by poll_changes (None: too many, reload everything)."""
+        changes, self.external_changes = self.external_changes, set()
+        return changes
+
+    def prune_changes(self, keep=100000):
+        """Delete all but the newest keep BookChanges rows and return the job's stats.
+
+        Connections that have fallen further behind than that reload
+        everything on their next poll instead of replaying the log.
+        """
+        start = time.perf_counter()
+        with self.transaction():
+            self.cursor.execute("DELETE FROM BookChanges WHERE Seq <= "
+                                "(SELECT seq FROM sqlite_sequence WHERE name = 'BookChanges') - ?", (keep,))
+            deleted = self.cursor.rowcount
+        return {"job": "prune", "deleted": deleted, "seconds": round(time.perf_counter() - start, 3)}
+
+    def catalogue(self, title="", author="", facets=()):
+        """Return the mirror if it is loaded, current and can answer this filter, else None.
+
+        The mirror only does substring matching, so it is skipped for FTS
+        queries and facet filters, and inside a transaction, whose writes it
+        hasn't seen yet.
+        Books other connections have changed are replayed into it first.
+        """
+        mirror = self.mirror
+        if mirror is None or not mirror.loaded or self.transaction_depth or facets:
+            return None
+        if self.fts_enabled and self.fts_query(title, author):
+            return None
+        self.poll_changes()
+        return mirror if mirror.loaded else None
+
+    @timed
+    def create_table(self):
+        """Create or upgrade the schema (and the full-text index) to the current version."""
+        self.migrate()
+        if self.use_fts:
+            self.create_fts_index()
+
+    def schema_version(self):
+        """Return the schema version stored in PRAGMA user_version."""
+        self.cursor.execute("PRAGMA user_version")
+        return self.cursor.fetchone()[0]
+
+    def migrate(self):
+        """Apply the pending SCHEMA_MIGRATIONS in place, one transaction per version."""
+        version = self.schema_version()
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"{self.db_name} has schema version {version}, "
+                               f"but this program only supports up to {SCHEMA_VERSION}.")
+        for number in range(version, SCHEMA_VERSION):
+            with self.transaction():
+                for statement in SCHEMA_MIGRATIONS[number]:
+                    self.cursor.execute(statement)
+                self.cursor.execute(f"PRAGMA user_version = {number + 1}")
+
+    def indexed_queries(self):
+        """Yield (name, query, params, expected) for the queries the program issues.
+
+        The SQL comes from the same builders and constants the methods use, so
+        the checks follow the code. expected is the index each query should
+        use, or a tuple of plan fragments any of which is fine; a full scan of
+        Books is only accepted where "SCAN Books" is listed.
+        """
+        book = (1, "m", "m", 1950, "Available")  # A page boundary
+        indexes = {"ID": "INTEGER PRIMARY KEY", "Title": "idx_books_title_nocase", "Author": "idx_books_author",
+                   "Year": "idx_books_year", "Status": "idx_books_status"}
+        for column in SORT_COLUMNS:
+            for descending in (False, True):
+                yield (f"next page by {column}{' descending' if descending else ''}",
+                       *self.page_query(sort=(column, descending), after=book), indexes[column])
+        yield "previous page by ID", *self.page_query(before=book), "INTEGER PRIMARY KEY"
+        if self.fts_enabled:
+            yield "page matching a title", *self.page_query(title="ring"), "BooksFTS"
+        fts_enabled, self.fts_enabled = self.fts_enabled, False
+        try:
+            # The substring fallback can't use an index for LIKE '%...%', but a
+            # page still walks the sort order and stops at the LIMIT
+            yield "first page containing a title", *self.page_query(title="ring"), ("SCAN Books",)
+            yield "next page containing a title", *self.page_query(title="ring", after=book), "INTEGER PRIMARY KEY"
+            yield ("next page containing a title by Title", *self.page_query(title="ring", sort=("Title", False), after=book),
+                   "idx_books_title_nocase")
+            yield "count containing a title", *self.count_query(title="ring"), ("SCAN Books",)
+        finally:
+            self.fts_enabled = fts_enabled
+        facets = {"Status": "Available", "Decade": 1950, "Author": "j r r tolkien"}
+        facet_indexes = {"Status": "idx_books_status", "Decade": "idx_books_year", "Author": "idx_books_author_norm"}
+        for facet, value in facets.items():
+            yield f"page within the {facet} facet", *self.page_query(facets=((facet, value),)), facet_indexes[facet]
+        yield "count by status", *self.count_query(status="Available"), "idx_books_status"
+        where, params = self.filter_clause()
+        yield ("single book", f"SELECT {BOOK_FIELDS} FROM Books WHERE BookID = ? AND {where}", [1] + params,
+               "INTEGER PRIMARY KEY")
+        for facet in FACET_NAMES:
+            yield f"{facet} facet counts", *self.facet_query(facet), ("idx_facet_counts", "PRIMARY KEY")
+        yield ("Status counts within an Author facet", *self.facet_query("Status", facets=(("Author", facets["Author"]),)),
+               "idx_books_author_norm")
+        # With few authors and ANALYZE statistics, a skip-scan of the covering
+        # (AuthorNorm, Year) index that needs no GROUP BY sort is as good
+        yield ("Author counts within a Decade facet", *self.facet_query("Author", facets=(("Decade", 1950),)),
+               ("idx_books_year", "idx_books_author_norm"))
+        # Status has two values, so with ANALYZE statistics a scan can beat the index
+        yield ("Decade counts within a Status facet", *self.facet_query("Decade", facets=(("Status", "Available"),)),
+               ("idx_books_status", "SCAN Books"))
+        yield ("duplicate candidates", DUPLICATE_CANDIDATES_SQL.format(condition=DUPLICATE_CANDIDATE),
+               ("tolkien|hob", 1937, "j r r tolkien", 1937), "idx_books_dedupe")
+        yield "changes since a sequence number", CHANGES_SINCE_SQL, (0,), "INTEGER PRIMARY KEY"
+        yield "current loans", OPEN_LOANS_SQL.format(condition=""), (100,), "idx_loans_open_due"
+        yield ("overdue loans", OPEN_LOANS_SQL.format(condition="AND Loans.DueAt < ?"), ("2000-01-01 00:00:00", 100),
+               "idx_loans_open_due")
+        yield "open loan of a book", OPEN_LOAN_SQL, (1,), "idx_loans_open_book"
+        yield "closing the open loan of a book", CLOSE_LOAN_SQL, ("2000-01-01 00:00:00", 1), "idx_loans_open_book"
+        yield "most borrowed", MOST_BORROWED_SQL, (10,), "idx_loan_counts"
+        yield "loan history of a book", LOAN_HISTORY_SQL, (1,), "idx_loans_book"
+
+    def check_query_plans(self):
+        """Run EXPLAIN QUERY PLAN over indexed_queries.
+
+        Returns (name, plan, ok) tuples, where ok is True when the plan uses
+        an expected index and scans the whole Books table only where allowed.
+        """
+        results = []
+        for name, query, params, expected in self.indexed_queries():
+            self.cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            plan = "; ".join(row[-1] for row in self.cursor.fetchall())
+            expected = expected if isinstance(expected, tuple) else (expected,)
+            full_scan = re.search(r"\bSCAN (TABLE )?Books\b(?! USING)", plan) is not None
+            results.append((name, plan, any(part in plan for part in expected)
+                            and (not full_scan or "SCAN Books" in expected)))
+        return results
+
+    def fts5_available(self):
+        """Check whether this SQLite build provides the FTS5 module."""
+        try:
+            self.cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            self.cursor.execute("DROP TABLE temp.fts5_probe")
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    def create_fts_index(self):
+        """Create the BooksFTS index over Title/Author and the triggers that keep it in sync.
+
+        Existing library.db files are migrated here: if the index or any of its
+        triggers is missing, the index is rebuilt once from the Books table.
+        """
+        self.cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE name IN ('BooksFTS', 'Books_fts_insert', 'Books_fts_delete', 'Books_fts_update')
+        """)
+        existing = {row[0] for row in self.cursor.fetchall()}
+
+        if not self.fts5_available():
+            # Without FTS5 the sync triggers would make every write fail, so drop
+            # them; the index is rebuilt when the file is next opened with FTS5.
+            with self.transaction():
+                for trigger in ('Books_fts_insert', 'Books_fts_delete', 'Books_fts_update'):
+                    self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            self.fts_enabled = False
+            return
+
+        with self.transaction():
+            self.cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS BooksFTS USING fts5(
+                    Title, Author,
+                    content='Books', content_rowid='BookID',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS Books_fts_insert AFTER INSERT ON Books BEGIN
+                    INSERT INTO BooksFTS (rowid, Title, Author)
+                    VALUES (new.BookID, new.Title, new.Author);
+                END
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS Books_fts_delete AFTER DELETE ON Books BEGIN
+                    INSERT INTO BooksFTS (BooksFTS, rowid, Title, Author)
+                    VALUES ('delete', old.BookID, old.Title, old.Author);
+                END
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS Books_fts_update AFTER UPDATE OF Title, Author ON Books BEGIN
+                    INSERT INTO BooksFTS (BooksFTS, rowid, Title, Author)
+                    VALUES ('delete', old.BookID, old.Title, old.Author);
+                    INSERT INTO BooksFTS (rowid, Title, Author)
+                    VALUES (new.BookID, new.Title, new.Author);
+                END
+            """)
+            if len(existing) < 4:
+                self.cursor.execute("INSERT INTO BooksFTS (BooksFTS) VALUES ('rebuild')")
+        self.fts_enabled = True
+
+    @staticmethod
+    def fts_query(title="", author=""):
+        """Build an FTS5 MATCH expression of prefix tokens, or None if a field has no tokens."""
+        terms = []
+        for column, text in (("Title", title), ("Author", author)):
+            tokens = re.findall(r"\w+", text)
+            if text and not tokens:
+                return None
+            terms.extend(f'{column} : "{token}"*' for token in tokens)
+        return " AND ".join(terms) or None
+
+    @timed
+    def add_book(self, title, author, year, check_duplicates=False):
+        """Add a new book to the database and return its BookID.
+
+        With check_duplicates, raises DuplicateBook instead if the book looks
+        like one already in the catalogue.
+        """
+        with self.transaction():
+            if check_duplicates:
+                matches = self.find_duplicates([(title, author, year)])[0]
+                if matches:
+                    raise DuplicateBook(matches)
+            self.cursor.execute("""
+                INSERT INTO Books (Title, Author, Year, Status, TitleNorm, AuthorNorm, DedupeKey)
+                VALUES (?, ?, ?, 'Available', ?, ?, ?)
+            """, (title, author, year, *book_keys(title, author)))
+            book_id = self.cursor.lastrowid
+            self.touch(book_id)
+        return book_id
+
+    @timed
+    def add_books(self, books, chunk_size=150):
+        """Insert many (title, author, year) rows in one transaction.
+
+        Rows go in as multi-row INSERTs of chunk_size books rather than one
+        statement per row: each statement on the triggered, indexed Books
+        table opens a statement journal, and inside a caller's savepoint
+        those journals kept growing until a 10,000-row batch took several
+        times longer than the previous one.
+        """
+        rows = [(title, author, year, *book_keys(title, author)) for title, author, year in books]
+        with self.transaction():
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                values = ", ".join(["(?, ?, ?, 'Available', ?, ?, ?)"] * len(chunk))
+                self.cursor.execute(f"""
+                    INSERT INTO Books (Title, Author, Year, Status, TitleNorm, AuthorNorm, DedupeKey)
+                    VALUES {values}
+                """, [value for row in chunk for value in row])
+            if self.mirror is not None and self.mirror.loaded and books:
+                # The write lock is held, so the new rows got consecutive ids ending at the largest
+                self.cursor.execute("SELECT MAX(BookID) FROM Books")
+                last_id = self.cursor.fetchone()[0]
+                self.touch(*range(last_id - len(books) + 1, last_id + 1))
+        return len(books)
+
+    @timed
+    def find_duplicates(self, books, chunk_size=200):
+        """Find existing books that look like duplicates of each (title, author, year).
+
+        Returns one list of matching book rows per input book. Candidates are
+        fetched by blocking key through idx_books_dedupe and
+        idx_books_author_norm, chunk_size books at a time, so the cost
+        depends on the size of the blocks rather than of the catalogue.
+        """
+        books = [(book_keys(title, author), year) for title, author, year in books]
+        results = []
+        for start in range(0, len(books), chunk_size):
+            chunk = books[start:start + chunk_size]
+            condition = " OR ".join([DUPLICATE_CANDIDATE] * len(chunk))
+            params = [value for keys, year in chunk for value in (keys[2], year, keys[1], year)]
+            self.cursor.execute(DUPLICATE_CANDIDATES_SQL.format(condition=condition), params)
+            index = DuplicateIndex()
+            for row in self.cursor.fetchall():
+                index.add(row[5:8], row[3], row[:5])
+            results.extend(index.matches(keys, year) for keys, year in chunk)
+        return results
+
+    def find_duplicate_groups(self, progress=None):
+        """Scan the whole catalogue for groups of near-duplicate books.
+
+        Walks the books in (DedupeKey, Year) and then (AuthorNorm, Year)
+        order, comparing each book only with the others in its block, and
+        joins matching pairs into groups. Returns lists of book rows, each
+        sorted by BookID; progress(rows_scanned) is called now and then.
+        """
+        parent = {}
+
+        def find(book_id):
+            while parent.get(book_id, book_id) != book_id:
+                book_id = parent[book_id]
+            return book_id
+
+        rows = {}
+        scanned = 0
+        for block_columns in ("DedupeKey, Year", "AuthorNorm, Year"):
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(f"SELECT {BOOK_FIELDS}, TitleNorm, AuthorNorm, {block_columns} "
+                               f"FROM Books ORDER BY {block_columns}, BookID")
+                block, block_key = [], None
+                while True:
+                    batch = cursor.fetchmany(10000)
+                    for row in batch:
+                        if row[7:] != block_key:
+                            block, block_key = [], row[7:]
+                        triple = (row[5], row[6], row[3])
+                        for other_triple, other in block:
+                            if similar_books(triple, other_triple):
+                                rows[row[0]], rows[other[0]] = row[:5], other[:5]
+                                parent[find(row[0])] = find(other[0])
+                        if len(block) < 1000:  # Huge blocks are only compared against their first rows
+                            block.append((triple, row))
+                    scanned += len(batch)
+                    if progress:
+                        progress(scanned)
+                    if not batch:
+                        break
+            finally:
+                cursor.close()
+
+        groups = {}
+        for book_id in rows:
+            groups.setdefault(find(book_id), []).append(rows[book_id])
+        return sorted((sorted(group) for group in groups.values()), key=lambda group: group[0][0])
+
+    @timed
+    def merge_duplicates(self, groups):
+        """Merge each group of duplicates into its lowest BookID, in one transaction.
+
+        The loan history and loan counts of the duplicates move to the kept
+        book and the duplicates are deleted. A duplicate that is currently
+        checked out is left alone. Returns (merged BookIDs, skipped BookIDs).
+        """
+        merged, skipped = [], []
+        with self.transaction():
+            for group in groups:
+                keep = group[0][0]
+                for book in group[1:]:
+                    book_id = book[0]
+                    self.cursor.execute(OPEN_LOAN_SQL, (book_id,))
+                    if self.cursor.fetchone() is not None:
+                        skipped.append(book_id)
+                        continue
+                    self.cursor.execute("UPDATE Loans SET BookID = ? WHERE BookID = ?", (keep, book_id))
+                    self.cursor.execute("""
+                        INSERT INTO BookLoanCounts (BookID, LoanCount)
+                        SELECT ?, LoanCount FROM BookLoanCounts WHERE BookID = ?
+                        ON CONFLICT (BookID) DO UPDATE SET LoanCount = LoanCount + excluded.LoanCount
+                    """, (keep, book_id))
+                    self.cursor.execute("DELETE FROM Books WHERE BookID = ?", (book_id,))
+                    self.touch(book_id)
+                    merged.append(book_id)
+        return merged, skipped
+
+    @timed
+    def get_book(self, book_id, title="", author="", facets=()):
+        """Retrieve a single book, or None if it doesn't exist or doesn't match the title/author/facet filter."""
+        where, params = self.filter_clause(title, author, facets)
+        self.cursor.execute(f"SELECT {BOOK_FIELDS} FROM Books WHERE BookID = ? AND {where}", [book_id] + params)
+        return self.cursor.fetchone()
+
+    @timed
+    def search_books(self, title="", author="", sort=None, facets=()):
+        """Search books based on title and/or author, narrowed by any facet filters.
+
+        Uses the FTS5 index (token/prefix matching, ranked by bm25) when it is
+        available, otherwise falls back to substring matching with LIKE. A
+        sort of (column, descending) orders the results in SQL instead.
+
+        Only this whole-result call ranks by bm25. The GUI's book list pages
+        with get_books_page, which returns FTS matches in BookID (or column)
+        order: a keyset page needs a key the boundary row carries, and rows
+        placed by live updates or filtered from a cached broader search
+        could not be put in rank order without re-running the query.
+        """
+        match = self.fts_query(title, author) if self.fts_enabled else None
+        if match and sort is None:
+            conditions = [facet_condition(facet, value) for facet, value in facets]
+            self.cursor.execute(f"""
+                SELECT Books.BookID, Books.Title, Books.Author, Books.Year, Books.Status FROM BooksFTS
+                JOIN Books ON Books.BookID = BooksFTS.rowid
+                WHERE BooksFTS MATCH ?{"".join(f" AND {condition}" for condition, _ in conditions)}
+                ORDER BY bm25(BooksFTS)
+            """, [match] + [param for _, params in conditions for param in params])
+            return self.cursor.fetchall()
+
+        where, params = self.filter_clause(title, author, facets)
+        query = f"SELECT {BOOK_FIELDS} FROM Books WHERE {where}"
+        if sort is not None:
+            query += f" ORDER BY {self.order_clause(sort)}"
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    @staticmethod
+    def sort_expression(sort):
+        """Return the SQL key expression and direction for a (column, descending) sort."""
+        column, descending = sort if sort else ("ID", False)
+        if column not in SORT_EXPRESSIONS:
+            raise ValueError(f"Cannot sort by {column}")
+        return SORT_EXPRESSIONS[column], "DESC" if descending else "ASC"
+
+    def order_clause(self, sort):
+        """Build an ORDER BY clause for a sort, with BookID as the tie-breaker."""
+        key, direction = self.sort_expression(sort)
+        if key == "BookID":
+            return f"BookID {direction}"
+        return f"{key} {direction}, BookID {direction}"
+
+    def filter_clause(self, title="", author="", facets=()):
+        """Build the WHERE clause and parameters for a title/author filter and facet filters."""
+        match = self.fts_query(title, author) if self.fts_enabled else None
+        if match:
+            clauses = ["BookID IN (SELECT rowid FROM BooksFTS WHERE BooksFTS MATCH ?)"]
+            params = [match]
+        else:
+            # Substring match on the normalized columns, so 'tolkien, j.r.r.' finds 'J. R. R. Tolkien'.
+            # Normalized text never contains the LIKE wildcards % and _.
+            clauses = ["1=1"]
+            params = []
+            if title:
+                clauses.append("TitleNorm LIKE ?")
+                params.append(f"%{normalize_title(title)}%")
+            if author:
+                clauses.append("AuthorNorm LIKE ?")
+                params.append(f"%{normalize_author(author)}%")
+        for facet, value in facets:
+            condition, values = facet_condition(facet, value)
+            clauses.append(condition)
+            params.extend(values)
+        return " AND ".join(clauses), params
+
+    @staticmethod
+    def fts_tokens(text):
+        """Split text into tokens the way the BooksFTS tokenizer does (case and diacritics folded)."""
+        folded = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+        return re.findall(r"[^\W_]+", folded.lower())
+
+    @classmethod
+    def book_matches(cls, book, title, author, fts, facets=()):
+        """Check in memory whether a book row matches a title/author/facet filter, as filter_clause would."""
+        if any(facet_value(facet, book) != value for facet, value in facets):
+            return False
+        if fts and cls.fts_query(title, author):
+            for text, query in ((book[1], title), (book[2], author)):
+                words = cls.fts_tokens(text)
+                if not all(any(word.startswith(token) for word in words) for token in cls.fts_tokens(query)):
+                    return False
+            return True
+        return normalize_title(title) in normalize_title(book[1]) and normalize_author(author) in normalize_author(book[2])
+
+    @classmethod
+    def narrows(cls, old_title, old_author, title, author, fts):
+        """Check whether every book matching (title, author) also matches (old_title, old_author).
+
+        Only cases book_matches can reproduce exactly are accepted.
+        """
+        if not old_title and not old_author:
+            return True
+        old_fts = bool(fts and cls.fts_query(old_title, old_author))
+        if old_fts != bool(fts and cls.fts_query(title, author)):
+            return False
+        for old, new, normalize in ((old_title, title, normalize_title), (old_author, author, normalize_author)):
+            if old_fts:
+                new_tokens = cls.fts_tokens(new)
+                if not all(any(token.startswith(old_token) for token in new_tokens) for old_token in cls.fts_tokens(old)):
+                    return False
+            elif normalize(old) not in normalize(new):
+                return False
+        return True
+
+    @timed
+    def get_books_page(self, title="", author="", sort=None, after=None, before=None, limit=100, facets=()):
+        """Fetch one page of books in sort order using keyset pagination.
+
+        sort is a (column, descending) pair using the GUI column names (default
+        BookID order). Pass the last row of the previous page as after to page
+        forwards, or the first row of the next page as before to page
+        backwards; the rows are always returned in display order. FTS
+        matches are not ranked by bm25 here (see search_books). Served from
+        the catalogue mirror when it is loaded and can answer the filter.
+        """
+        mirror = self.catalogue(title, author, facets)
+        if mirror is not None:
+            rows = mirror.page(title, author, sort, after, before, limit)
+            if rows is not None:
+                return rows
+        self.cursor.execute(*self.page_query(title, author, sort, after, before, limit, facets))
+        rows = self.cursor.fetchall()
+        return rows if before is None else rows[::-1]
+
+    def page_query(self, title="", author="", sort=None, after=None, before=None, limit=100, facets=()):
+        """Build the SQL and parameters get_books_page runs; a before page comes back in reverse order."""
+        key, direction = self.sort_expression(sort)
+        column = SORT_COLUMNS.index(sort[0]) if sort else 0
+        where, params = self.filter_clause(title, author, facets)
+
+        boundary = after if after is not None else before
+        forwards = before is None
+        if boundary is not None:
+            # Rows strictly after (or before) the boundary in (key, BookID) order
+            op = ">" if forwards == (direction == "ASC") else "<"
+            if key == "BookID":
+                where += f" AND BookID {op} ?"
+                params = params + [boundary[0]]
+            else:
+                # Spelled out rather than as a row value so the index can seek to the boundary
+                where += f" AND {key} {op}= ? AND ({key} {op} ? OR BookID {op} ?)"
+                params = params + [boundary[column], boundary[column], boundary[0]]
+
+        order = self.order_clause(sort if forwards else (sort[0] if sort else "ID", direction == "ASC"))
+        return f"SELECT {BOOK_FIELDS} FROM Books WHERE {where} ORDER BY {order} LIMIT ?", params + [limit]
+
+    @timed
+    def count_books(self, title="", author="", status=None, facets=()):
+        """Count the books matching a title/author/facet filter and, optionally, a status."""
+        mirror = self.catalogue(title, author, facets)
+        if mirror is not None:
+            return mirror.count(title, author, status)
+        self.cursor.execute(*self.count_query(title, author, status, facets))
+        return self.cursor.fetchone()[0]
+
+    def count_query(self, title="", author="", status=None, facets=()):
+        """Build the SQL and parameters count_books runs."""
+        where, params = self.filter_clause(title, author, facets)
+        if status is not None:
+            where += " AND Status = ?"
+            params = params + [status]
+        return f"SELECT COUNT(*) FROM Books WHERE {where}", params
+
+    def iter_books(self, title="", author="", batch_size=1000, facets=()):
+        """Yield lists of matching books in BookID order, fetching batch_size rows at a time.
+
+        Uses its own cursor so the full result set is never held in memory.
+        """
+        where, params = self.filter_clause(title, author, facets)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT {BOOK_FIELDS} FROM Books WHERE {where} ORDER BY BookID", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    @timed
+    def facet_counts(self, title="", author="", facets=(), top_authors=10):
+        """Count the books matching a filter by Status, by decade and for the top authors.
+
+        Returns {facet: [(value, label, count), ...]} for each of FACET_NAMES.
+        Each facet is counted with the other facet filters applied but not its
+        own, so the alternatives to a chosen value stay visible. Without a
+        title/author filter or other facets the counts come straight from
+        BookFacetCounts; otherwise they are GROUP BY queries over the matching
+        books. Results are cached until this or another connection writes.
+        """
+        version = (self.generation, self.read_data_version())
+        if version != self.facet_cache_version:
+            self.facet_cache.clear()
+            self.facet_cache_version = version
+        key = (title, author, facets, top_authors)
+        if key in self.facet_cache:
+            return self.facet_cache[key]
+
+        counts = {}
+        for facet in FACET_NAMES:
+            others = tuple(item for item in facets if item[0] != facet)
+            self.cursor.execute(*self.facet_query(facet, title, author, others, top_authors))
+            counts[facet] = self.cursor.fetchall()
+
+        labels = {}
+        for value, _ in counts["Author"]:
+            # Show one of the spellings stored under this AuthorNorm
+            self.cursor.execute("SELECT Author FROM Books WHERE AuthorNorm = ? LIMIT 1", (value,))
+            row = self.cursor.fetchone()
+            labels[value] = row[0] if row else value
+        result = {
+            "Status": [(value, value, count) for value, count in counts["Status"]],
+            "Decade": [(value, f"{value}s", count) for value, count in counts["Decade"]],
+            "Author": [(value, labels[value], count) for value, count in counts["Author"]],
+        }
+        if len(self.facet_cache) >= 64:
+            self.facet_cache.pop(next(iter(self.facet_cache)))
+        self.facet_cache[key] = result
+        return result
+
+    def facet_query(self, facet, title="", author="", facets=(), top_authors=10):
+        """Build the SQL and parameters facet_counts runs to count one facet's values under a filter."""
+        limit = top_authors if facet == "Author" else -1
+        order = "2 DESC, 1" if facet == "Author" else "1"
+        if not title and not author and not facets:
+            return f"SELECT Value, Books FROM BookFacetCounts WHERE Facet = ? ORDER BY {order} LIMIT ?", [facet, limit]
+        where, params = self.filter_clause(title, author, facets)
+        group = FACET_GROUPS[facet]
+        query = f"SELECT {group}, COUNT(*) FROM Books WHERE {where} GROUP BY {group} ORDER BY {order} LIMIT ?"
+        return query, params + [limit]
+
+    @timed
+    def update_status(self, book_id, status):
+        """Set the status of a book (Available/Checked Out) and return the updated row.
+
+        Unlike check_out/check_in this doesn't fail when the status is already
+        set; changing it opens or closes a loan for an unknown borrower.
+        """
+        with self.transaction():
+            book = self.get_book(book_id)
+            if book is not None and book[4] != status:
+                if status == "Checked Out":
+                    self.check_out(book_id, "Unknown")
+                elif status == "Available":
+                    self.check_in(book_id)
+                else:
+                    raise ValueError(f"Invalid status: {status}")
+        return self.get_book(book_id)
+
+    @timed
+    def check_out(self, book_id, borrower, loan_days=14, now=None):
+        """Check out an available book and open a loan for it, atomically.
+
+        The status change is conditional on the book still being Available,
+        so two desks can't lend the same copy; the loser gets a
+        CheckoutConflict. Returns the updated row, or None if the book
+        doesn't exist.
+        """
+        now = now or datetime.now(timezone.utc)
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE Books
+                SET Status = 'Checked Out'
+                WHERE BookID = ? AND Status = 'Available'
+            """, (book_id,))
+            if self.cursor.rowcount == 0:
+                book = self.get_book(book_id)
+                if book is None:
+                    return None
+                raise CheckoutConflict(book_id, book[4])
+            self.touch(book_id)
+            self.cursor.execute("""
+                INSERT INTO Loans (BookID, Borrower, CheckedOutAt, DueAt)
+                VALUES (?, ?, ?, ?)
+            """, (book_id, borrower, utc_timestamp(now), utc_timestamp(now + timedelta(days=loan_days))))
+        return self.get_book(book_id)
+
+    @timed
+    def check_in(self, book_id, now=None):
+        """Check in a checked-out book and close its open loan, atomically.
+
+        Raises CheckoutConflict if the book is already available. Returns the
+        updated row, or None if the book doesn't exist.
+        """
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE Books
+                SET Status = 'Available'
+                WHERE BookID = ? AND Status = 'Checked Out'
+            """, (book_id,))
+            if self.cursor.rowcount == 0:
+                book = self.get_book(book_id)
+                if book is None:
+                    return None
+                raise CheckoutConflict(book_id, book[4])
+            self.touch(book_id)
+            self.cursor.execute(CLOSE_LOAN_SQL, (utc_timestamp(now), book_id))
+        return self.get_book(book_id)
+
+    def get_books(self, book_ids, chunk_size=500, fields=BOOK_FIELDS):
+        """Return {BookID: row} for the given ids, querying chunk_size ids at a time."""
+        book_ids = list(book_ids)
+        books = {}
+        for start in range(0, len(book_ids), chunk_size):
+            chunk = book_ids[start:start + chunk_size]
+            self.cursor.execute(f"SELECT {fields} FROM Books WHERE BookID IN ({', '.join('?' * len(chunk))})", chunk)
+            books.update((row[0], row) for row in self.cursor.fetchall())
+        return books
+
+    def change_statuses(self, book_ids, from_status, to_status, loan_sql, loan_params):
+        """Move every listed book from from_status to to_status in one transaction.
+
+        BEGIN IMMEDIATE holds the write lock, so the statuses read at the start
+        can't change before the executemany UPDATEs run. Returns (books,
+        conflicts): the updated rows, and (BookID, row) pairs for the books
+        that weren't in from_status, with row None for books that don't exist.
+        """
+        book_ids = list(dict.fromkeys(book_ids))
+        with self.transaction():
+            current = self.get_books(book_ids)
+            eligible = [book_id for book_id in book_ids
+                        if book_id in current and current[book_id][4] == from_status]
+            conflicts = [(book_id, current.get(book_id)) for book_id in book_ids
+                         if book_id not in current or current[book_id][4] != from_status]
+            self.cursor.executemany(f"""
+                UPDATE Books
+                SET Status = '{to_status}'
+                WHERE BookID = ? AND Status = '{from_status}'
+            """, [(book_id,) for book_id in eligible])
+            self.cursor.executemany(loan_sql, [loan_params(book_id) for book_id in eligible])
+            self.touch(*eligible)
+        return [current[book_id][:4] + (to_status,) for book_id in eligible], conflicts
+
+    @timed
+    def check_out_many(self, book_ids, borrower, loan_days=14, now=None):
+        """Check out many books to one borrower atomically; see change_statuses for the result."""
+        now = now or datetime.now(timezone.utc)
+        checked_out, due = utc_timestamp(now), utc_timestamp(now + timedelta(days=loan_days))
+        return self.change_statuses(book_ids, "Available", "Checked Out", """
+            INSERT INTO Loans (BookID, Borrower, CheckedOutAt, DueAt)
+            VALUES (?, ?, ?, ?)
+        """, lambda book_id: (book_id, borrower, checked_out, due))
+
+    @timed
+    def check_in_many(self, book_ids, now=None):
+        """Check in many books atomically; see change_statuses for the result."""
+        returned = utc_timestamp(now)
+        return self.change_statuses(book_ids, "Checked Out", "Available", CLOSE_LOAN_SQL,
+                                    lambda book_id: (returned, book_id))
+
+    @timed
+    def current_loans(self, limit=100):
+        """Return open loans as (LoanID, BookID, Title, Borrower, CheckedOutAt, DueAt), soonest due first."""
+        self.cursor.execute(OPEN_LOANS_SQL.format(condition=""), (limit,))
+        return self.cursor.fetchall()
+
+    @timed
+    def overdue_loans(self, now=None, limit=100):
+        """Return open loans that were due before now, in the same shape as current_loans."""
+        self.cursor.execute(OPEN_LOANS_SQL.format(condition="AND Loans.DueAt < ?"), (utc_timestamp(now), limit))
+        return self.cursor.fetchall()
+
+    @timed
+    def most_borrowed(self, limit=10):
+        """Return (BookID, Title, Author, LoanCount) for the most borrowed books."""
+        self.cursor.execute(MOST_BORROWED_SQL, (limit,))
+        return self.cursor.fetchall()
+
+    @timed
+    def loan_history(self, book_id):
+        """Return (LoanID, Borrower, CheckedOutAt, DueAt, ReturnedAt) for every loan of a book, newest first."""
+        self.cursor.execute(LOAN_HISTORY_SQL, (book_id,))
+        return self.cursor.fetchall()
+
+    @timed
+    def update_book(self, book_id, title, author, year):
+        """Update the details of a book and return the updated row."""
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE Books
+                SET Title = ?, Author = ?, Year = ?, TitleNorm = ?, AuthorNorm = ?, DedupeKey = ?
+                WHERE BookID = ?
+            """, (title, author, year, *book_keys(title, author), book_id))
+            self.touch(book_id)
+        return self.get_book(book_id)
+
+    @timed
+    def delete_book(self, book_id):
+        """Delete a book from the database and return the number of rows removed."""
+        with self.transaction():
+            self.cursor.execute("""
+                DELETE FROM Books
+                WHERE BookID = ?
+            """, (book_id,))
+            deleted = self.cursor.rowcount
+            self.touch(book_id)
+        return deleted
+
+    @timed
+    def delete_books(self, book_ids):
+        """Delete many books with one executemany in one transaction and return the ids removed."""
+        book_ids = list(dict.fromkeys(book_ids))
+        with self.transaction():
+            existing = self.get_books(book_ids)
+            deleted = [book_id for book_id in book_ids if book_id in existing]
+            self.cursor.executemany("DELETE FROM Books WHERE BookID = ?", [(book_id,) for book_id in deleted])
+            self.touch(*deleted)
+        return deleted
+
+    @timed
+    def get_all_books(self, sort=None):
+        """Retrieve all books from the database, optionally ordered by a (column, descending) sort."""
+        mirror = self.catalogue()
+        if mirror is not None:
+            rows = mirror.page(sort=sort, limit=None)
+            if rows is not None:
+                return rows
+        query = f"SELECT {BOOK_FIELDS} FROM Books"
+        if sort is not None:
+            query += f" ORDER BY {self.order_clause(sort)}"
+        self.cursor.execute(query)
+        return self.cursor.fetchall()
+
+    def file_stats(self):
+        """Return the page size, page and free page counts, and auto_vacuum mode of the database file."""
+        stats = {}
+        for name in ("page_size", "page_count", "freelist_count", "auto_vacuum"):
+            self.cursor.execute(f"PRAGMA {name}")
+            stats[name] = self.cursor.fetchone()[0]
+        return stats
+
+    def backup(self, path, pages=None, sleep=0.005, progress=None):
+        """Copy the database to path with the online backup API and return the job's stats.
+
+        In WAL mode the copy is made in one step: it only holds a read
+        snapshot, which doesn't block writers, and a stepped copy would be
+        restarted by every write from another connection. Otherwise it copies
+        pages (default 256) at a time, sleeping between steps so writers can
+        get the lock. The copy is written to path + ".partial" and renamed over
+        path once complete. progress(copied, total) is called after each step.
+        """
+        if os.path.abspath(path) == os.path.abspath(self.db_name):
+            raise ValueError("The backup must not overwrite the database itself.")
+        if pages is None:
+            self.cursor.execute("PRAGMA journal_mode")
+            pages = -1 if self.cursor.fetchone()[0].lower() == "wal" else 256
+        start = time.perf_counter()
+        steps = total = restarts = 0
+        copied = -1
+
+        def step(status, remaining, count):
+            nonlocal steps, total, restarts, copied
+            steps += 1
+            if count - remaining < copied:
+                restarts += 1
+            copied, total = count - remaining, count
+            if progress:
+                progress(copied, count)
+
+        partial = path + ".partial"
+        target = sqlite3.connect(partial)
+        try:
+            self.conn.backup(target, pages=pages, progress=step, sleep=sleep)
+        except BaseException:
+            target.close()
+            os.remove(partial)
+            raise
+        target.close()
+        os.replace(partial, path)
+        return {"job": "backup", "path": path, "pages": total, "steps": steps, "restarts": restarts,
+                "bytes": os.path.getsize(path), "seconds": round(time.perf_counter() - start, 3)}
+
+    def snapshot(self, path):
+        """Write a compacted, defragmented copy of the database to path with VACUUM INTO.
+
+        Unlike backup() this is one statement: it holds a read transaction for
+        the whole copy but never restarts. Returns the job's stats.
+        """
+        if os.path.abspath(path) == os.path.abspath(self.db_name):
+            raise ValueError("The snapshot must not overwrite the database itself.")
+        start = time.perf_counter()
+        partial = path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        self.cursor.execute("VACUUM INTO ?", (partial,))
+        os.replace(partial, path)
+        return {"job": "snapshot", "path": path, "bytes": os.path.getsize(path),
+                "seconds": round(time.perf_counter() - start, 3)}
+
+    def optimize(self, analyze=False):
+        """Refresh the query planner statistics and merge the full-text index; return the job's stats.
+
+        PRAGMA optimize only re-analyzes the tables whose statistics are
+        stale, so it is cheap enough to run often; analyze runs a full ANALYZE.
+        """
+        start = time.perf_counter()
+        self.cursor.execute("ANALYZE" if analyze else "PRAGMA optimize")
+        self.cursor.fetchall()
+        if self.fts_enabled:
+            with self.transaction():
+                self.cursor.execute("INSERT INTO BooksFTS (BooksFTS) VALUES ('optimize')")
+        return {"job": "analyze" if analyze else "optimize", "seconds": round(time.perf_counter() - start, 3)}
+
+    def vacuum(self, pages=None, full=False):
+        """Return free pages to the file system and return the job's stats.
+
+        With auto_vacuum=INCREMENTAL this frees up to pages free pages (all
+        of them by default) without rebuilding the file. Otherwise, or with
+        full, the whole database is rebuilt with VACUUM, which also switches
+        it to the configured auto_vacuum mode; that rewrites the file and
+        blocks writers while it runs.
+        """
+        start = time.perf_counter()
+        before = self.file_stats()
+        if full or before["auto_vacuum"] != 2:
+            mode = "full"
+            self.cursor.execute(f"PRAGMA auto_vacuum = {self.settings.get('auto_vacuum', before['auto_vacuum'])}")
+            self.cursor.execute("VACUUM")
+        else:
+            mode = "incremental"
+            # execute() stops after one step of a statement with no result columns, which for
+            # incremental_vacuum frees a single page; executescript runs it to completion
+            self.conn.executescript("PRAGMA incremental_vacuum" + ("" if pages is None else f"({int(pages)})"))
+        after = self.file_stats()
+        return {"job": "vacuum", "mode": mode, "auto_vacuum": after["auto_vacuum"],
+                "pages_before": before["page_count"], "pages_after": after["page_count"],
+                "free_pages_left": after["freelist_count"], "seconds": round(time.perf_counter() - start, 3)}
+
+    def close(self):
+        """Close the database connection."""
+        if self.conn:
+            self.conn.close()
+
+# Book validation and bulk import
+def validate_book(title, author, year):
+    """Validate book fields with the same rules as the Add Book form.
+
+    Returns the cleaned (title, author, year) tuple, or raises ValueError
+    with the message shown to the user.
+    """
+    title = str(title if title is not None else "").strip()
+    author = str(author if author is not None else "").strip()
+    year = str(year if year is not None else "").strip()
+    if not title or not author or not year:
+        raise ValueError("Please fill in all fields.")
+    if not year.isdigit():
+        raise ValueError("Year must be a number.")
+    return title, author, int(year)
+
+
+def read_import_records(path, fmt=None):
+    """Stream (line number, record dict) pairs from a CSV or JSON Lines file."""
+    fmt = fmt or ("jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    with open(path, newline='', encoding='utf-8-sig') as f:  # utf-8-sig skips the BOM Excel writes
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+        elif fmt == "jsonl":
+            for line_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_num, {"error": f"Invalid JSON: {e}"}
+                    continue
+                if not isinstance(record, dict):
+                    yield line_num, {"error": "Expected a JSON object."}
+                    continue
+                yield line_num, {str(k).strip().lower(): v for k, v in record.items()}
+        else:
+            raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def import_books(db, path, fmt=None, batch_size=5000, reject_path=None, progress=None, check_duplicates=True):
+    """Bulk import books from a CSV or JSON Lines file.
+
+    Records are parsed as a stream and validated with validate_book; valid
+    rows are inserted by add_books, one transaction per batch_size rows.
+    With check_duplicates, rows that look like a book already in the
+    catalogue or earlier in the same batch are rejected too (earlier batches
+    are in the catalogue by then). Rejected rows are written to reject_path
+    (a CSV with the line number and the reason) and progress(imported,
+    rejected) is called after each batch. Returns the (imported, rejected)
+    counts.
+    """
+    imported = rejected = 0
+    batch = []
+    reject_file = reject_writer = None
+
+    def reject(line_num, record, error):
+        nonlocal rejected, reject_file, reject_writer
+        rejected += 1
+        if reject_path:
+            if reject_writer is None:
+                reject_file = open(reject_path, 'w', newline='', encoding='utf-8')
+                reject_writer = csv.writer(reject_file)
+                reject_writer.writerow(["Line", "Title", "Author", "Year", "Error"])
+            reject_writer.writerow([line_num, record.get("title"), record.get("author"), record.get("year"), error])
+
+    def flush():
+        nonlocal imported
+        books = [book for _, _, book in batch]
+        with db.transaction():
+            if check_duplicates:
+                seen = DuplicateIndex()
+                unique = []
+                for (line_num, record, book), matches in zip(batch, db.find_duplicates(books)):
+                    keys = book_keys(book[0], book[1])
+                    earlier = seen.matches(keys, book[2])
+                    if matches:
+                        reject(line_num, record, f"Possible duplicate of Book ID {matches[0][0]}")
+                    elif earlier:
+                        reject(line_num, record, f"Possible duplicate of line {earlier[0]}")
+                    else:
+                        seen.add(keys, book[2], line_num)
+                        unique.append(book)
+                books = unique
+            imported += db.add_books(books)
+        batch.clear()
+        if progress:
+            progress(imported, rejected)
+
+    try:
+        for line_num, record in read_import_records(path, fmt):
+            try:
+                if "error" in record:
+                    raise ValueError(record["error"])
+                batch.append((line_num, record, validate_book(record.get("title"), record.get("author"), record.get("year"))))
+            except ValueError as e:
+                reject(line_num, record, e)
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        elif progress:
+            progress(imported, rejected)
+    finally:
+        if reject_file:
+            reject_file.close()
+    return imported, rejected
+
+# Streaming export
+BOOK_COLUMNS = ("BookID", "Title", "Author", "Year", "Status")
+
+
+def export_books(db, path, fmt=None, title="", author="", batch_size=5000, progress=None, facets=()):
+    """Export the books matching a title/author/facet filter to CSV, JSON Lines or Parquet.
+
+    Rows are streamed from the database in batch_size chunks and written as
+    they arrive, so memory use does not grow with the table. Parquet output
+    writes one row group per batch and needs the optional pyarrow package.
+    Returns the number of rows written.
+    """
+    if fmt is None:
+        fmt = {".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}.get(os.path.splitext(path)[1].lower(), "csv")
+    batches = db.iter_books(title, author, batch_size, facets)
+    written = 0
+
+    if fmt == "csv":
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(BOOK_COLUMNS)
+            for rows in batches:
+                writer.writerows(rows)
+                written += len(rows)
+                if progress:
+                    progress(written)
+    elif fmt == "jsonl":
+        with open(path, 'w', encoding='utf-8') as f:
+            for rows in batches:
+                f.writelines(json.dumps(dict(zip(BOOK_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+                written += len(rows)
+                if progress:
+                    progress(written)
+    elif fmt == "parquet":
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires the pyarrow package.")
+        schema = pyarrow.schema([("BookID", pyarrow.int64()), ("Title", pyarrow.string()),
+                                 ("Author", pyarrow.string()), ("Year", pyarrow.int64()),
+                                 ("Status", pyarrow.string())])
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for rows in batches:
+                columns = [list(column) for column in zip(*rows)]
+                writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+                written += len(rows)
+                if progress:
+                    progress(written)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return written
+
+# Maintenance jobs
+MAINTENANCE_JOBS = ("backup", "snapshot", "optimize", "analyze", "vacuum", "prune")
+
+
+def run_maintenance(db, jobs, directory="backups", keep=7, pages=None, vacuum_pages=None, full_vacuum=False,
+                    keep_changes=100000):
+    """Run maintenance jobs against db in order, yielding each job's stats as it finishes.
+
+    Backups and snapshots are written to directory as
+    <database>-<UTC time to the microsecond>.<job>.db and only the newest
+    keep of each kind are kept. An existing copy is never overwritten: if the
+    name is taken (say, on a coarse clock), the time in it is moved on a
+    microsecond. Each stats dict includes the UTC start time and the seconds
+    taken.
+    """
+    stem = os.path.splitext(os.path.basename(db.db_name))[0]
+    for job in jobs:
+        moment = datetime.now(timezone.utc)
+        if job in ("backup", "snapshot"):
+            os.makedirs(directory, exist_ok=True)
+            named = moment
+            while True:
+                path = os.path.join(directory, f"{stem}-{named:%Y%m%d-%H%M%S-%f}.{job}.db")
+                if not os.path.exists(path) and not os.path.exists(path + ".partial"):
+                    break
+                named += timedelta(microseconds=1)
+            stats = db.backup(path, pages=pages) if job == "backup" else db.snapshot(path)
+            stats["pruned"] = prune_copies(directory, stem, job, keep)
+        elif job in ("optimize", "analyze"):
+            stats = db.optimize(analyze=job == "analyze")
+        elif job == "vacuum":
+            stats = db.vacuum(vacuum_pages, full=full_vacuum)
+        elif job == "prune":
+            stats = db.prune_changes(keep_changes)
+        else:
+            raise ValueError(f"Unknown maintenance job: {job}")
+        yield {"at": utc_timestamp(moment), **stats}
+
+
+def prune_copies(directory, stem, job, keep):
+    """Delete all but the newest keep backups (or snapshots) of a database; return the deleted paths."""
+    # Copies made before names had microseconds still match
+    pattern = re.compile(re.escape(stem) + r"-\d{8}-\d{6}(-\d{6})?\." + job + r"\.db")
+    copies = sorted(name for name in os.listdir(directory) if pattern.fullmatch(name))
+    removed = [os.path.join(directory, name) for name in copies[:max(len(copies) - keep, 0)]]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+# Headless HTTP/JSON service
+class PoolTimeout(Exception):
+    """Raised when no pooled database connection frees up in time."""
+
+
+class ConnectionPool:
+    """A bounded pool of LibraryDatabase connections for server threads.
+
+    Each connection is only ever used by the thread that checked it out, so
+    threads never share a cursor.
+    """
+    def __init__(self, db_name, size=4, settings=None, timeout=5.0, metrics=None):
+        self.timeout = timeout
+        self.metrics = metrics
+        self.connections = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self.connections.put(LibraryDatabase(db_name, settings=settings, check_same_thread=False,
+                                                 metrics=metrics))
+
+    @contextmanager
+    def connection(self, deadline=None):
+        """Check out a connection, waiting at most self.timeout.
+
+        With a deadline (a time.monotonic() value), a query still running at
+        the deadline is interrupted and fails with sqlite3.OperationalError.
+        """
+        try:
+            db = self.connections.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout("All database connections are busy.")
+        if deadline is not None:
+            db.conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        try:
+            yield db
+        finally:
+            db.conn.set_progress_handler(None, 0)
+            if db.conn.in_transaction:
+                db.conn.rollback()
+            self.connections.put(db)
+
+    def close(self):
+        """Close every pooled connection."""
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+class LibraryRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over LibraryDatabase.
+
+        GET    /books?title=&author=&sort=Title&desc=1&after=<BookID>&after_key=<value>&limit=100
+        GET    /books/<id>
+        POST   /books                  {"title", "author", "year", "allow_duplicate"}
+        PUT    /books/<id>             {"title", "author", "year", "status"}
+        POST   /books/<id>/checkin
+        POST   /books/<id>/checkout    {"borrower", "days"}
+        DELETE /books/<id>
+        GET    /health
+        GET    /metrics                query timings, when started with --metrics
+    """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # Read timeout for slow or idle clients, applied to the socket by setup()
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        """Route a request and translate errors into JSON error responses."""
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        deadline = time.monotonic() + self.server.request_timeout
+        try:
+            if parts == ["health"] and method == "GET":
+                return self.send_json(200, {"status": "ok"})
+            if parts == ["metrics"] and method == "GET":
+                metrics = self.server.pool.metrics
+                if metrics is None:
+                    return self.send_json(404, {"error": "Metrics are disabled; start the server with --metrics."})
+                return self.send_json(200, metrics.snapshot())
+            if not parts or parts[0] != "books" or len(parts) > 3:
+                return self.send_json(404, {"error": "Not found."})
+            book_id = self.parse_book_id(parts[1]) if len(parts) > 1 else None
+            action = parts[2] if len(parts) > 2 else None
+            body = self.read_json() if method in ("POST", "PUT") else {}
+            with self.server.pool.connection(deadline) as db:
+                status, payload = self.handle_api(db, method, book_id, action, query, body)
+            self.send_json(status, payload)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except CheckoutConflict as e:
+            self.send_json(409, {"error": str(e), "status": e.status})
+        except DuplicateBook as e:
+            self.send_json(409, {"error": str(e), "duplicates": [self.book_json(book) for book in e.matches]})
+        except PoolTimeout as e:
+            self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                self.send_json(504, {"error": "The request timed out."})
+            else:
+                self.send_json(500, {"error": str(e)})
+        except sqlite3.Error as e:
+            self.send_json(500, {"error": str(e)})
+
+    def handle_api(self, db, method, book_id, action, query, body):
+        """Run one API call against a pooled connection and return (status, payload)."""
+        if book_id is None:
+            if method == "GET":
+                sort = (query["sort"], query.get("desc") in ("1", "true")) if query.get("sort") else None
+                if sort and sort[0] not in SORT_COLUMNS:
+                    raise ValueError(f"Cannot sort by {sort[0]}")
+                column = SORT_COLUMNS.index(sort[0]) if sort else 0
+                limit = self.parse_int(query.get("limit", 100), "limit")
+                if limit < 1:
+                    raise ValueError("limit must be at least 1.")
+                after = self.page_boundary(db, query, column) if query.get("after") else None
+                if after is None and query.get("after"):
+                    return 404, {"error": f"Book {query['after']} not found; pass after_key to page past it."}
+                books = db.get_books_page(query.get("title", ""), query.get("author", ""), sort, after=after,
+                                          limit=min(limit, 1000))
+                payload = {"books": [self.book_json(book) for book in books]}
+                if books:
+                    payload["next"] = {"after": books[-1][0], "after_key": books[-1][column]}
+                return 200, payload
+            if method == "POST":
+                title, author, year = validate_book(body.get("title"), body.get("author"), body.get("year"))
+                book_id = db.add_book(title, author, year, check_duplicates=not body.get("allow_duplicate"))
+                return 201, self.book_json(db.get_book(book_id))
+            return 405, {"error": "Method not allowed."}
+
+        if action is None and method == "GET":
+            book = db.get_book(book_id)
+        elif action is None and method == "PUT":
+            title, author, year = validate_book(body.get("title"), body.get("author"), body.get("year"))
+            if body.get("status") not in (None, "", "Available", "Checked Out"):
+                raise ValueError("Status must be 'Available' or 'Checked Out'.")
+            with db.transaction():
+                book = db.update_book(book_id, title, author, year)
+                if book is not None and body.get("status"):
+                    book = db.update_status(book_id, body["status"])
+        elif action is None and method == "DELETE":
+            if db.delete_book(book_id):
+                return 200, {"deleted": book_id}
+            book = None
+        elif action == "checkin" and method == "POST":
+            book = db.check_in(book_id)
+        elif action == "checkout" and method == "POST":
+            borrower = str(body.get("borrower") or "").strip()
+            if not borrower:
+                raise ValueError("Please give the borrower's name.")
+            book = db.check_out(book_id, borrower, self.parse_int(body.get("days", 14), "days"))
+        else:
+            return 405, {"error": "Method not allowed."}
+        if book is None:
+            return 404, {"error": f"Book {book_id} not found."}
+        return 200, self.book_json(book)
+
+    def page_boundary(self, db, query, column):
+        """Return the row to page after, as far as keyset pagination needs it.
+
+        Only the BookID and the sort column are compared, so with after_key
+        (the sort value of that row, as returned in "next") the row need not
+        exist any more. Otherwise it is re-read, and None means it is gone.
+        """
+        book_id = self.parse_book_id(query["after"])
+        if column == 0:
+            return (book_id, None, None, None, None)
+        if "after_key" not in query:
+            return db.get_book(book_id)
+        value = query["after_key"]
+        if SORT_COLUMNS[column] == "Year":
+            value = self.parse_int(value, "after_key")
+        boundary = [book_id, None, None, None, None]
+        boundary[column] = value
+        return tuple(boundary)
+
+    @staticmethod
+    def book_json(book):
+        return dict(zip(BOOK_COLUMNS, book))
+
+    @staticmethod
+    def parse_int(value, name):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be an integer.")
+
+    def parse_book_id(self, value):
+        return self.parse_int(value, "Book ID")
+
+    def read_json(self):
+        """Read and decode the JSON object in the request body."""
+        length = self.parse_int(self.headers.get("Content-Length", 0), "Content-Length")
+        if length > self.server.max_body:
+            raise ValueError("Request body is too large.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ValueError("Request body must be JSON.")
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object.")
+        return body
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class LibraryHTTPServer(HTTPServer):
+    """HTTP server that handles requests on a fixed-size thread pool.
+
+    At most workers requests run at once and max_pending more may wait for
+    a thread; beyond that new connections get an immediate 503, so a burst
+    of clients can't pile up unbounded threads or memory.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, pool, workers=8, max_pending=64, request_timeout=10.0, max_body=1 << 20):
+        super().__init__(address, LibraryRequestHandler)
+        self.pool = pool
+        self.request_timeout = request_timeout
+        self.max_body = max_body
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        self.workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="library-http")
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.reject(request)
+            return
+        self.workers.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def reject(self, request):
+        """Answer 503 without reading the request when the server is saturated."""
+        body = b'{"error": "Server is busy."}'
+        try:
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                            b"Retry-After: 1\r\nConnection: close\r\n"
+                            b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.workers.shutdown(wait=True)
+        self.pool.close()
+
+# Background database executor
+class DatabaseJob:
+    """A queued call to run against the database on the worker thread."""
+    def __init__(self, func, args, kwargs, key, on_done, on_error):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+
+
+class DatabaseExecutor:
+    """Run LibraryDatabase calls on a single worker thread that owns the sqlite3 connection.
+
+    Jobs are queued with submit() and run in order; their results are handed
+    back to the Tk main loop by polling a result queue with root.after, so
+    callbacks always run on the GUI thread. Jobs submitted with the same key
+    supersede each other: submitting a new one cancels the previous one, and a
+    cancelled job that is already running is interrupted.
+    """
+    def __init__(self, root, db_factory=LibraryDatabase, on_busy=None, poll_interval=50):
+        self.root = root
+        self.on_busy = on_busy
+        self.poll_interval = poll_interval
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.notifications = queue.Queue()
+        self.lock = threading.Lock()
+        self.db = None
+        self.current = None
+        self.outstanding = set()
+        self.latest = {}
+        self.poll_id = None
+        self.thread = threading.Thread(target=self._run, args=(db_factory,), daemon=True)
+        self.thread.start()
+        self._poll()
+
+    def submit(self, func, *args, key=None, on_done=None, on_error=None, background=False, **kwargs):
+        """Queue func(db, *args, **kwargs) and return its DatabaseJob.
+
+        Background jobs, such as the change poll, don't show the busy indicator.
+        """
+        if key is not None:
+            self.cancel_key(key)
+        job = DatabaseJob(func, args, kwargs, key, on_done, on_error)
+        if key is not None:
+            self.latest[key] = job
+        if not background:
+            self.outstanding.add(job)
+        self.requests.put(job)
+        self._notify_busy()
+        return job
+
+    def post(self, callback, *args):
+        """Schedule callback(*args) on the Tk main loop; safe to call from the worker thread."""
+        self.notifications.put((callback, args))
+
+    def cancel(self, job):
+        """Cancel a job; a job that is already running has its query interrupted."""
+        job.cancelled = True
+        with self.lock:
+            if self.current is job and self.db is not None:
+                self.db.conn.interrupt()
+        self.outstanding.discard(job)
+        self._notify_busy()
+
+    def cancel_key(self, key):
+        """Cancel the pending job submitted under key, if any."""
+        job = self.latest.pop(key, None)
+        if job is not None:
+            self.cancel(job)
+
+    @property
+    def generation(self):
+        """The database write generation, or None until the worker has opened the database."""
+        return self.db.generation if self.db is not None else None
+
+    @property
+    def fts_enabled(self):
+        """Whether the worker's database searches through the FTS5 index."""
+        return self.db is not None and self.db.fts_enabled
+
+    def is_pending(self, key):
+        """Check whether a job submitted under key is still outstanding."""
+        return key in self.latest
+
+    def shutdown(self, timeout=2.0):
+        """Stop the worker thread after the queued jobs and close the connection."""
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.requests.put(None)
+        self.thread.join(timeout)
+
+    def _run(self, db_factory):
+        """Worker thread: open the database, then execute jobs until shut down."""
+        try:
+            self.db = db_factory()
+        except Exception as e:
+            startup_error = e
+        else:
+            startup_error = None
+
+        while True:
+            job = self.requests.get()
+            if job is None:
+                break
+            with self.lock:
+                if job.cancelled:
+                    self.results.put((job, None, None))
+                    continue
+                self.current = job
+            try:
+                if startup_error is not None:
+                    raise startup_error
+                result, error = job.func(self.db, *job.args, **job.kwargs), None
+            except Exception as e:
+                result, error = None, e
+            with self.lock:
+                self.current = None
+            self.results.put((job, result, error))
 
-    def connect(self):
-        """Connect to the SQLite database."""
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
+        if self.db is not None:
+            self.db.close()
 
-    def create_table(self):
-        """Create the Books table if it doesn't exist."""
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Books (
-                BookID INTEGER PRIMARY KEY AUTOINCREMENT,
-                Title TEXT NOT NULL,
-                Author TEXT NOT NULL,
-                Year INTEGER NOT NULL,
-                Status TEXT NOT NULL CHECK (Status IN ('Available', 'Checked Out'))
-            )
-        """)
-        self.conn.commit()
+    def _poll(self):
+        """Deliver finished jobs to their callbacks on the Tk main loop."""
+        try:
+            while True:
+                try:
+                    callback, args = self.notifications.get_nowait()
+                except queue.Empty:
+                    break
+                callback(*args)
+            while True:
+                try:
+                    job, result, error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                self.outstanding.discard(job)
+                if job.key is not None and self.latest.get(job.key) is job:
+                    del self.latest[job.key]
+                self._notify_busy()
+                if job.cancelled:
+                    continue
+                if error is not None:
+                    if job.on_error:
+                        job.on_error(error)
+                    else:
+                        messagebox.showerror("Database Error", f"Database operation failed. Error: {error}")
+                elif job.on_done:
+                    job.on_done(result)
+        finally:
+            self.poll_id = self.root.after(self.poll_interval, self._poll)
 
-    def add_book(self, title, author, year):
-        """Add a new book to the database."""
-        self.cursor.execute("""
-            INSERT INTO Books (Title, Author, Year, Status)
-            VALUES (?, ?, ?, 'Available')
-        """, (title, author, year))
-        self.conn.commit()
-
-    def search_books(self, title="", author=""):
-        """Search books based on title and/or author."""
-        query = "SELECT * FROM Books WHERE 1=1"
-        params = []
-        if title:
-            query += " AND Title LIKE ?"
-            params.append(f"%{title}%")
-        if author:
-            query += " AND Author LIKE ?"
-            params.append(f"%{author}%")
-        self.cursor.execute(query, params)
-        return self.cursor.fetchall()
+    def _notify_busy(self):
+        """Tell the GUI whether any jobs are still outstanding."""
+        if self.on_busy:
+            self.on_busy(bool(self.outstanding))
 
-    def update_status(self, book_id, status):
-        """Update the status of a book (Available/Checked Out)."""
-        self.cursor.execute("""
-            UPDATE Books
-            SET Status = ?
-            WHERE BookID = ?
-        """, (status, book_id))
-        self.conn.commit()
+# Search result cache
+class SearchCache:
+    """LRU cache of first-page search results keyed by (title, author, facets, sort).
 
-    def update_book(self, book_id, title, author, year):
-        """Update the details of a book."""
-        self.cursor.execute("""
-            UPDATE Books
-            SET Title = ?, Author = ?, Year = ?
-            WHERE BookID = ?
-        """, (title, author, year, book_id))
-        self.conn.commit()
+    Entries are only valid for the LibraryDatabase.generation they were read
+    at; the whole cache is dropped when the generation moves on. A complete
+    result (every match fit on the page) also answers narrower queries, such
+    as "tolk" after "tol" or an added facet filter, by filtering its rows in
+    memory.
+    """
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = None
 
-    def delete_book(self, book_id):
-        """Delete a book from the database."""
-        self.cursor.execute("""
-            DELETE FROM Books
-            WHERE BookID = ?
-        """, (book_id,))
-        self.conn.commit()
-
-    def get_all_books(self):
-        """Retrieve all books from the database."""
-        self.cursor.execute("SELECT * FROM Books")
-        return self.cursor.fetchall()
+    def get(self, title, author, sort, generation, fts, facets=()):
+        """Return cached (rows, complete) for a query, or None on a miss."""
+        if generation != self.generation:
+            self.entries.clear()
+            self.generation = generation
+            return None
 
-    def close(self):
-        """Close the database connection."""
-        if self.conn:
-            self.conn.close()
+        key = (title, author, facets, sort)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        superset = None
+        for (old_title, old_author, old_facets, old_sort), (rows, complete) in reversed(self.entries.items()):
+            if (complete and old_sort == sort and set(old_facets) <= set(facets)
+                    and LibraryDatabase.narrows(old_title, old_author, title, author, fts)):
+                superset = rows
+                break
+        if superset is None:
+            return None
+        rows = [book for book in superset if LibraryDatabase.book_matches(book, title, author, fts, facets)]
+        self.put(title, author, sort, generation, rows, True, facets)
+        return rows, True
+
+    def put(self, title, author, sort, generation, rows, complete, facets=()):
+        """Cache the rows of a query read at generation."""
+        if generation != self.generation:
+            self.entries.clear()
+            self.generation = generation
+        key = (title, author, facets, sort)
+        self.entries[key] = (rows, complete)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
 
 # GUI class
 class LibraryGUI:
-    def __init__(self, root):
+    def __init__(self, root, db_name="library.db", settings=None, metrics=None, started=None, report_startup=False,
+                 mirror_max_bytes=None):
+        # Startup milestones in ms since started (default: now), for tracking time to first paint
+        self.started = time.perf_counter() if started is None else started
+        self.startup_times = OrderedDict()
+        self.report_startup = report_startup
+
         self.root = root
         self.root.title("Library Management System")
-        self.db = LibraryDatabase()
+        self.metrics = metrics
+        self.mirror_max_bytes = mirror_max_bytes
+        self.executor = DatabaseExecutor(root, lambda: LibraryDatabase(db_name, settings=settings, metrics=metrics,
+                                                                       mirror_max_bytes=mirror_max_bytes),
+                                         on_busy=self.set_busy)
 
-        # Set window size
-        self.root.geometry("1000x800")
-        self.create_widgets()
+        # Windowed view: only page_size-sized pages around the visible rows are
+        # kept in the Treeview, never more than max_rows at once
+        self.page_size = 100
+        self.max_rows = 300
+        self.current_filter = ("", "")
+        self.current_facets = ()  # Facet filters chosen in the facet panel, see FACET_NAMES
+        self.current_sort = None
+        self.loaded_rows = {}  # Treeview item id -> book row, for keyset bounds and ordering
+        self.more_before = False
+        self.more_after = False
+        self.loading_page = False
+
+        # Search-as-you-type debounce and result cache
+        self.search_delay = 300  # Milliseconds of typing pause before searching
+        self.search_after_id = None
+        self.search_cache = SearchCache()
+
+        # Changes made by other programs sharing the database, polled once the first rows are shown
+        self.change_poll_interval = 1000  # Milliseconds
+        self.change_poll_id = None
+
+        # Facet panel: item id -> (facet, value), and the generation its counts were read at
+        self.facet_items = {}
+        self.facet_labels = {}  # (facet, value) -> label, for chosen values that drop out of the counts
+        self.facets_generation = None
 
         # Initialize sort settings
         self.sort_column = None
         self.sort_reverse = False
 
+        # Set window size
+        self.root.geometry("1000x800")
+        self.create_widgets()
+        self.mark_startup("widgets_built")
+
+        # The schema check runs as soon as the worker thread opens the database,
+        # but the first page is only requested once the window is on screen
+        self.executor.submit(lambda db: None, on_done=lambda _: self.mark_startup("database_ready"),
+                             on_error=lambda e: None)  # The first page load reports the error
+        self.root.bind("<Map>", self.on_first_map, add="+")
+
     def create_widgets(self):
         """Create the main GUI components within a single tab."""
         # Initialize style
@@ -170,6 +2905,31 @@ class LibraryGUI:
                   background=[('active', '#2980B9')],
                   foreground=[('active', 'white')])
 
+        # ---------------------------- Menu Bar ----------------------------
+        menubar = tk.Menu(self.root)
+        file_menu = tk.Menu(menubar, tearoff=0)
+        file_menu.add_command(label="Import Books...", command=self.import_books)
+        file_menu.add_command(label="Export Results...", command=self.export_books)
+        file_menu.add_command(label="Back Up Database...", command=self.backup_database)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self.on_closing)
+        menubar.add_cascade(label="File", menu=file_menu)
+        reports_menu = tk.Menu(menubar, tearoff=0)
+        reports_menu.add_command(label="Current Loans", command=self.show_current_loans)
+        reports_menu.add_command(label="Overdue Loans", command=self.show_overdue_loans)
+        reports_menu.add_command(label="Most Borrowed", command=self.show_most_borrowed)
+        reports_menu.add_command(label="Possible Duplicates", command=self.show_duplicates)
+        menubar.add_cascade(label="Reports", menu=reports_menu)
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        tools_menu.add_command(label="Diagnostics", command=self.show_diagnostics)
+        menubar.add_cascade(label="Tools", menu=tools_menu)
+        self.root.config(menu=menubar)
+
+        # Status bar for progress of long-running jobs
+        self.status_var = tk.StringVar()
+        status_bar = ttk.Label(self.root, textvariable=self.status_var, anchor=tk.W)
+        status_bar.pack(side=tk.BOTTOM, fill='x', padx=10)
+
         # Create a single frame to hold all sections
         main_frame = ttk.Frame(self.root)
         main_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -224,11 +2984,26 @@ class LibraryGUI:
         btn_show_all.grid(column=2, row=2, padx=10, pady=10, sticky=tk.W)
         ToolTip(btn_show_all, "Reset search filters and display all books")
 
+        self.btn_cancel_search = ttk.Button(search_fields_frame, text="Cancel", command=self.cancel_search, state=tk.DISABLED)
+        self.btn_cancel_search.grid(column=3, row=2, padx=10, pady=10, sticky=tk.W)
+        ToolTip(self.btn_cancel_search, "Cancel the search that is still running")
+
+        # Busy indicator shown while database work is running in the background
+        self.busy_bar = ttk.Progressbar(search_fields_frame, mode='indeterminate', length=120)
+        self.busy_bar.grid(column=4, row=2, padx=10, pady=10, sticky=tk.W)
+        self.busy_bar.grid_remove()
+
+        # Search as you type: each keystroke restarts the debounce timer
+        for entry in (self.search_title, self.search_author):
+            entry.bind("<KeyRelease>", self.schedule_search)
+            entry.bind("<Return>", lambda event: self.display_books())
+
         # Results Treeview
         tree_frame = ttk.Frame(search_display_frame)
         tree_frame.pack(fill='both', expand=True, padx=10, pady=10)
 
-        self.tree_books = ttk.Treeview(tree_frame, columns=("ID", "Title", "Author", "Year", "Status"), show='headings')
+        self.tree_books = ttk.Treeview(tree_frame, columns=("ID", "Title", "Author", "Year", "Status"), show='headings',
+                                       selectmode='extended')
         self.tree_books.heading("ID", text="ID")
         self.tree_books.heading("Title", text="Title")
         self.tree_books.heading("Author", text="Author")
@@ -241,9 +3016,18 @@ class LibraryGUI:
         self.tree_books.column("Status", width=120, anchor=tk.CENTER)
         self.tree_books.pack(side=tk.LEFT, fill='both', expand=True)
 
-        scrollbar_books = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree_books.yview)
-        self.tree_books.configure(yscroll=scrollbar_books.set)
-        scrollbar_books.pack(side=tk.LEFT, fill='y')
+        self.scrollbar_books = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree_books.yview)
+        self.tree_books.configure(yscroll=self.on_tree_scroll)
+        self.scrollbar_books.pack(side=tk.LEFT, fill='y')
+
+        # Facet panel: book counts for the current search by status, decade and author
+        self.tree_facets = ttk.Treeview(tree_frame, columns=("Books",), selectmode='none')
+        self.tree_facets.heading("#0", text="Filter by (click to toggle)")
+        self.tree_facets.heading("Books", text="Books")
+        self.tree_facets.column("#0", width=180)
+        self.tree_facets.column("Books", width=70, anchor=tk.E)
+        self.tree_facets.pack(side=tk.LEFT, fill='y', padx=(10, 0))
+        self.tree_facets.bind("<ButtonRelease-1>", self.on_facet_click)
 
         # ---------------------------- Manage Books Section ----------------------------
         manage_frame = ttk.LabelFrame(main_frame, text="Manage Selected Book")
@@ -280,56 +3064,455 @@ class LibraryGUI:
         for col in ("ID", "Title", "Author", "Year", "Status"):
             self.tree_books.heading(col, text=col, command=lambda _col=col: self.sort_treeview(_col, False))
 
-        # Load all books initially
+    def on_first_map(self, event):
+        """Once the main window has been drawn, start loading the first page of books."""
+        if event.widget is not self.root:
+            return
+        self.root.unbind("<Map>")
+        self.root.update_idletasks()
+        self.mark_startup("first_paint")
         self.display_books()
 
+    def mark_startup(self, milestone):
+        """Record when a startup milestone was reached (only the first time)."""
+        if milestone in self.startup_times:
+            return
+        elapsed = time.perf_counter() - self.started
+        self.startup_times[milestone] = round(elapsed * 1000, 1)
+        if self.metrics is not None:
+            self.metrics.record_method(f"startup:{milestone}", elapsed)
+        if milestone == "first_rows":
+            self.status_var.set(f"Window shown after {self.startup_times.get('first_paint', 0):.0f} ms, "
+                                f"first books after {self.startup_times[milestone]:.0f} ms")
+            if self.report_startup:
+                print(json.dumps({"startup_ms": self.startup_times}), file=sys.stderr)
+            self.change_poll_id = self.root.after(self.change_poll_interval, self.poll_changes)
+            if self.mirror_max_bytes is not None:
+                self.executor.submit(LibraryDatabase.load_mirror, on_done=self.mirror_loaded,
+                                     on_error=lambda e: self.status_var.set(f"Catalogue cache unavailable: {e}"))
+
+    def mirror_loaded(self, stats):
+        """Report the size of the in-memory catalogue mirror once it has loaded."""
+        if stats["loaded"]:
+            self.status_var.set(f"Catalogue cached in memory: {stats['rows']} books, "
+                                f"{stats['bytes'] / (1 << 20):.1f} of {stats['max_bytes'] / (1 << 20):.0f} MiB")
+        else:
+            self.status_var.set(f"Catalogue not cached in memory: it {stats['disabled']}")
+
     def reset_search(self):
-        """Reset search fields and display all books."""
+        """Reset search fields and facet filters and display all books."""
         self.search_title.delete(0, tk.END)
         self.search_author.delete(0, tk.END)
+        self.current_facets = ()
         self.display_books()
         messagebox.showinfo("Search Reset", "Search filters have been cleared. Displaying all books.")
 
-    def add_book(self):
-        """Handle adding a new book."""
-        title = self.entry_title.get().strip()
-        author = self.entry_author.get().strip()
-        year = self.entry_year.get().strip()
-
-        if not title or not author or not year:
-            messagebox.showwarning("Input Error", "Please fill in all fields.")
-            return
-
-        if not year.isdigit():
-            messagebox.showwarning("Input Error", "Year must be a number.")
+    def add_book(self, allow_duplicate=False):
+        """Handle adding a new book, asking first if it looks like one already in the catalogue."""
+        try:
+            title, author, year = validate_book(self.entry_title.get(), self.entry_author.get(), self.entry_year.get())
+        except ValueError as e:
+            messagebox.showwarning("Input Error", str(e))
             return
 
-        try:
-            self.db.add_book(title, author, int(year))
+        def on_added(book_id):
             messagebox.showinfo("Success", f"Book '{title}' added successfully.")
             self.entry_title.delete(0, tk.END)
             self.entry_author.delete(0, tk.END)
             self.entry_year.delete(0, tk.END)
-            self.display_books()  # Refresh the book list
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to add book. Error: {e}")
+            self.refresh_book(book_id)  # Show the new row if it fits the current view
+
+        def on_failed(error):
+            if not isinstance(error, DuplicateBook):
+                messagebox.showerror("Error", f"Failed to add book. Error: {error}")
+            elif messagebox.askyesno("Possible Duplicate", f"{error}\n\nAdd '{title}' anyway?"):
+                self.add_book(allow_duplicate=True)
+
+        self.executor.submit(LibraryDatabase.add_book, title, author, year, check_duplicates=not allow_duplicate,
+                             on_done=on_added, on_error=on_failed)
+
+    def import_books(self):
+        """Import books from a CSV or JSON Lines file chosen by the user."""
+        path = filedialog.askopenfilename(
+            title="Import Books",
+            filetypes=[("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl *.ndjson"), ("All files", "*.*")])
+        if not path:
+            return
+        reject_path = os.path.splitext(path)[0] + ".rejects.csv"
+
+        def progress(imported, rejected):
+            self.executor.post(self.status_var.set, f"Importing... {imported} books imported, {rejected} rejected")
+
+        def on_imported(counts):
+            imported, rejected = counts
+            self.status_var.set(f"Import finished: {imported} books imported, {rejected} rejected")
+            message = f"Imported {imported} books."
+            if rejected:
+                message += f"\n{rejected} rows were rejected; see {reject_path}."
+            messagebox.showinfo("Import Complete", message)
+            self.display_books()
+
+        def on_failed(error):
+            self.status_var.set("Import failed")
+            messagebox.showerror("Error", f"Failed to import books. Error: {error}")
+
+        self.status_var.set("Importing...")
+        self.executor.submit(import_books, path, reject_path=reject_path, progress=progress,
+                             on_done=on_imported, on_error=on_failed)
+
+    def backup_database(self):
+        """Copy the open database to a file chosen by the user with the online backup API."""
+        path = filedialog.asksaveasfilename(title="Back Up Database", defaultextension=".db",
+                                            filetypes=[("SQLite databases", "*.db"), ("All files", "*.*")])
+        if not path:
+            return
+
+        def progress(copied, total):
+            self.executor.post(self.status_var.set, f"Backing up... {copied} of {total} pages")
+
+        def on_done(stats):
+            self.status_var.set(f"Backed up {stats['pages']} pages to {path} in {stats['seconds']:.1f} s")
+
+        def on_failed(error):
+            self.status_var.set("Backup failed")
+            messagebox.showerror("Error", f"Failed to back up the database. Error: {error}")
+
+        self.status_var.set("Backing up...")
+        self.executor.submit(LibraryDatabase.backup, path, progress=progress, on_done=on_done, on_error=on_failed)
+
+    def export_books(self):
+        """Export the books matching the current search filter to a file chosen by the user."""
+        path = filedialog.asksaveasfilename(
+            title="Export Results", defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl"), ("Parquet files", "*.parquet")])
+        if not path:
+            return
+        title, author = self.current_filter
+
+        def progress(written):
+            self.executor.post(self.status_var.set, f"Exporting... {written} books written")
+
+        def on_exported(written):
+            self.status_var.set(f"Export finished: {written} books written to {path}")
+            messagebox.showinfo("Export Complete", f"Exported {written} books to {path}.")
+
+        def on_failed(error):
+            self.status_var.set("Export failed")
+            messagebox.showerror("Error", f"Failed to export books. Error: {error}")
+
+        self.status_var.set("Exporting...")
+        self.executor.submit(export_books, path, title=title, author=author, facets=self.current_facets, progress=progress,
+                             on_done=on_exported, on_error=on_failed)
 
     def display_books(self):
-        """Display books based on search criteria or show all."""
+        """Display the first page of books matching the search criteria (or all books)."""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
         title = self.search_title.get().strip()
         author = self.search_author.get().strip()
+        sort = (self.sort_column, self.sort_reverse) if self.sort_column else None
+        facets = self.current_facets
+        self.current_filter = (title, author)
+        self.current_sort = sort
+
+        # A new search supersedes any search or page load still in flight
+        self.executor.cancel_key("search")
+        self.executor.cancel_key("page")
+        self.loading_page = False
+
+        cached = self.search_cache.get(title, author, sort, self.executor.generation, self.executor.fts_enabled, facets)
+        if cached is not None:
+            self.show_first_page(cached[0])
+            self.refresh_facets()
+            return
+
+        limit = self.page_size
+
+        def fetch(db):
+            # Read the generation first so a concurrent write can only make the entry look older
+            return db.generation, db.get_books_page(title, author, sort, limit=limit, facets=facets)
+
+        def on_fetched(result):
+            generation, books = result
+            self.search_cache.put(title, author, sort, generation, books, len(books) < limit, facets)
+            self.show_first_page(books)
 
-        if title or author:
-            books = self.db.search_books(title, author)
+        self.executor.submit(fetch, key="search", on_done=on_fetched,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to load books. Error: {e}"))
+        self.refresh_facets()
+
+    def refresh_facets(self):
+        """Recount the facet panel for the current search on the worker thread."""
+        title, author = self.current_filter
+        facets = self.current_facets
+
+        def fetch(db):
+            return db.generation, db.facet_counts(title, author, facets)
+
+        def on_counted(result):
+            generation, counts = result
+            if self.current_filter == (title, author) and self.current_facets == facets:
+                self.facets_generation = generation
+                self.show_facets(counts)
+
+        self.executor.submit(fetch, key="facets", background=True, on_done=on_counted,
+                             on_error=lambda e: self.status_var.set(f"Could not count books by facet: {e}"))
+
+    def show_facets(self, counts):
+        """Fill the facet panel from facet_counts, marking the chosen values with a tick."""
+        self.tree_facets.delete(*self.tree_facets.get_children())
+        self.facet_items.clear()
+        chosen = dict(self.current_facets)
+        for facet, heading in (("Status", "Status"), ("Decade", "Decade"), ("Author", "Top Authors")):
+            parent = self.tree_facets.insert('', tk.END, text=heading, open=True)
+            rows = counts[facet]
+            if facet in chosen and chosen[facet] not in [value for value, _, _ in rows]:
+                rows = rows + [(chosen[facet], self.facet_labels.get((facet, chosen[facet]), chosen[facet]), 0)]
+            for value, label, count in rows:
+                mark = "\u2713 " if chosen.get(facet) == value else ""
+                item = self.tree_facets.insert(parent, tk.END, text=f"{mark}{label}", values=(count,))
+                self.facet_items[item] = (facet, value)
+                self.facet_labels[(facet, value)] = label
+
+    def on_facet_click(self, event):
+        """Add the clicked facet value to the search filter, or remove it if it was already chosen."""
+        item = self.tree_facets.identify_row(event.y)
+        if item not in self.facet_items:
+            return
+        facet, value = self.facet_items[item]
+        chosen = dict(self.current_facets)
+        if chosen.get(facet) == value:
+            del chosen[facet]
+        else:
+            chosen[facet] = value
+        self.current_facets = tuple(sorted(chosen.items()))
+        self.display_books()
+
+    def schedule_search(self, event=None):
+        """Restart the debounce timer so the search runs once typing pauses."""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(self.search_delay, self.run_scheduled_search)
+
+    def run_scheduled_search(self):
+        """Run the debounced search unless the search fields haven't actually changed."""
+        self.search_after_id = None
+        if (self.search_title.get().strip(), self.search_author.get().strip()) != self.current_filter:
+            self.display_books()
+
+    def show_first_page(self, books):
+        """Replace the Treeview contents with the first page of a search."""
+        # Clear previous results in a single call
+        self.tree_books.delete(*self.tree_books.get_children())
+        self.loaded_rows.clear()
+        for book in books:
+            self.insert_row(tk.END, book)
+        self.more_before = False
+        self.more_after = len(books) == self.page_size
+        self.tree_books.yview_moveto(0)
+        if "first_rows" not in self.startup_times:
+            self.root.update_idletasks()
+            self.mark_startup("first_rows")
+
+    def cancel_search(self):
+        """Cancel the running search and any pending page load."""
+        self.executor.cancel_key("search")
+        self.executor.cancel_key("page")
+        self.loading_page = False
+
+    def set_busy(self, busy):
+        """Show or hide the busy indicator and enable Cancel while a search is pending."""
+        if busy:
+            self.busy_bar.grid()
+            self.busy_bar.start(10)
         else:
-            books = self.db.get_all_books()
+            self.busy_bar.stop()
+            self.busy_bar.grid_remove()
+        searching = self.executor.is_pending("search") or self.executor.is_pending("page")
+        self.btn_cancel_search.configure(state=tk.NORMAL if searching else tk.DISABLED)
+
+    def on_tree_scroll(self, first, last):
+        """Update the scrollbar and fetch another page when the view nears either end."""
+        self.scrollbar_books.set(first, last)
+        if self.loading_page:
+            return
+        if float(last) > 0.9 and self.more_after:
+            self.loading_page = True
+            self.root.after_idle(self.load_next_page)
+        elif float(first) < 0.1 and self.more_before:
+            self.loading_page = True
+            self.root.after_idle(self.load_previous_page)
+
+    def load_next_page(self):
+        """Request the page of books after the last loaded row."""
+        children = self.tree_books.get_children()
+        if not children:
+            self.loading_page = False
+            return
+        self.executor.submit(LibraryDatabase.get_books_page, *self.current_filter, self.current_sort,
+                             after=self.loaded_rows[children[-1]], limit=self.page_size, facets=self.current_facets,
+                             key="page", on_done=self.append_page, on_error=self.page_failed)
 
-        # Clear previous results
-        for item in self.tree_books.get_children():
-            self.tree_books.delete(item)
+    def load_previous_page(self):
+        """Request the page of books before the first loaded row."""
+        children = self.tree_books.get_children()
+        if not children:
+            self.loading_page = False
+            return
+        self.executor.submit(LibraryDatabase.get_books_page, *self.current_filter, self.current_sort,
+                             before=self.loaded_rows[children[0]], limit=self.page_size, facets=self.current_facets,
+                             key="page", on_done=self.prepend_page, on_error=self.page_failed)
 
+    def append_page(self, books):
+        """Append a fetched page and drop rows that scrolled far out of view at the top."""
+        self.loading_page = False
+        children = self.tree_books.get_children()
+        top = round(self.tree_books.yview()[0] * len(children))
+        books = [book for book in books if not self.tree_books.exists(str(book[0]))]
         for book in books:
-            self.tree_books.insert('', tk.END, values=book)
+            self.insert_row(tk.END, book)
+        self.more_after = len(books) == self.page_size
+
+        excess = len(children) + len(books) - self.max_rows
+        if excess > 0:
+            self.delete_rows(children[:excess])
+            self.more_before = True
+            top -= excess
+        self.tree_books.yview_moveto(max(top, 0) / max(len(self.tree_books.get_children()), 1))
+
+    def prepend_page(self, books):
+        """Prepend a fetched page and drop rows that scrolled far out of view at the bottom."""
+        self.loading_page = False
+        children = self.tree_books.get_children()
+        top = round(self.tree_books.yview()[0] * len(children))
+        books = [book for book in books if not self.tree_books.exists(str(book[0]))]
+        for index, book in enumerate(books):
+            self.insert_row(index, book)
+        self.more_before = len(books) == self.page_size
+
+        excess = len(children) + len(books) - self.max_rows
+        if excess > 0:
+            self.delete_rows(children[-excess:])
+            self.more_after = True
+        top += len(books)
+        self.tree_books.yview_moveto(top / max(len(self.tree_books.get_children()), 1))
+
+    def insert_row(self, index, book):
+        """Insert a book into the Treeview at index, keyed by its BookID."""
+        item_id = str(book[0])
+        self.tree_books.insert('', index, iid=item_id, values=book)
+        self.loaded_rows[item_id] = book
+
+    def delete_rows(self, item_ids):
+        """Remove items from the Treeview in a single call."""
+        self.tree_books.delete(*item_ids)
+        for item_id in item_ids:
+            self.loaded_rows.pop(item_id, None)
+
+    def page_failed(self, error):
+        """Report a failed page load and allow scrolling to retry it."""
+        self.loading_page = False
+        messagebox.showerror("Error", f"Failed to load more books. Error: {error}")
+
+    def refresh_book(self, book_id):
+        """Re-read one book and apply it to the Treeview without reloading the list."""
+        search_filter = self.current_filter
+        facets = self.current_facets
+        sort = self.current_sort
+
+        def on_loaded(book):
+            # Ignore the row if a different search or sort has been displayed meanwhile
+            if self.current_filter == search_filter and self.current_facets == facets and self.current_sort == sort:
+                self.apply_book_change(book_id, book)
+
+        self.executor.submit(LibraryDatabase.get_book, book_id, *search_filter, facets, on_done=on_loaded)
+
+    def apply_book_change(self, book_id, book):
+        """Insert, update or delete the Treeview item for one book.
+
+        Items use the BookID as their item id, so the Treeview itself maps
+        books to items. A book of None (deleted, or no longer matching the
+        search filter) removes the item; otherwise the row is placed at its
+        position in the current sort order, unless that falls outside the
+        loaded window.
+        """
+        item_id = str(book_id)
+        if self.tree_books.exists(item_id):
+            self.delete_rows([item_id])
+        if book is None:
+            return
+
+        children = self.tree_books.get_children()
+        index = self.find_sorted_index(children, book)
+        if (index == len(children) and self.more_after) or (index == 0 and self.more_before):
+            return
+        self.insert_row(index, book)
+
+    def poll_changes(self):
+        """Apply the books other programs have changed to the Treeview, then poll again later.
+
+        The worker checks PRAGMA data_version and only reads the changed
+        books, so an idle poll costs one PRAGMA whatever the catalogue size.
+        """
+        self.change_poll_id = None
+        search_filter = self.current_filter
+        facets = self.current_facets
+        sort = self.current_sort
+
+        def fetch(db):
+            db.poll_changes()
+            changes = db.take_external_changes()
+            if not changes:
+                return changes
+            # Deleted books, and books that no longer match the search, stay None and leave the view
+            changed = dict.fromkeys(sorted(changes))
+            for book_id, book in db.get_books(changed).items():
+                if LibraryDatabase.book_matches(book, *search_filter, db.fts_enabled, facets):
+                    changed[book_id] = book
+            return changed
+
+        def on_polled(changes):
+            self.change_poll_id = self.root.after(self.change_poll_interval, self.poll_changes)
+            if changes is None:
+                self.status_var.set("The catalogue was changed elsewhere; reloading")
+                self.display_books()
+            elif changes and self.current_filter == search_filter and self.current_facets == facets \
+                    and self.current_sort == sort:
+                for book_id, book in changes.items():
+                    self.apply_book_change(book_id, book)
+            elif changes:
+                self.display_books()  # The search changed while polling; its cached rows may be stale
+            if self.executor.generation != self.facets_generation:
+                self.refresh_facets()  # Our own writes or other programs' changed the counts
+
+        def on_failed(error):
+            self.change_poll_id = self.root.after(self.change_poll_interval, self.poll_changes)
+            self.status_var.set(f"Could not check for changes: {error}")
+
+        self.executor.submit(fetch, key="changes", background=True, on_done=on_polled, on_error=on_failed)
+
+    def find_sorted_index(self, children, book):
+        """Binary search the loaded rows for the position of book in the current sort order."""
+        col, reverse = self.current_sort or ("ID", False)
+        key = self.sort_key(col, book)
+        low, high = 0, len(children)
+        while low < high:
+            mid = (low + high) // 2
+            mid_key = self.sort_key(col, self.loaded_rows[children[mid]])
+            if (mid_key > key) if reverse else (mid_key < key):
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    @staticmethod
+    def sort_key(col, book):
+        """Return the (value, BookID) key that orders a book the way SORT_EXPRESSIONS does in SQL."""
+        value = book[SORT_COLUMNS.index(col)]
+        if col in ("Title", "Author"):
+            value = value.translate(NOCASE_FOLD)
+        return (value, book[0])
 
     def get_selected_book(self):
         """Retrieve the currently selected book."""
@@ -337,10 +3520,20 @@ class LibraryGUI:
         if not selected_item:
             messagebox.showwarning("Selection Error", "Please select a book from the list.")
             return None
+        if len(selected_item) > 1:
+            messagebox.showwarning("Selection Error", "Please select only one book to edit.")
+            return None
 
-        book = self.tree_books.item(selected_item)['values']
+        book = self.loaded_rows[selected_item[0]]
         return book
 
+    def get_selected_books(self):
+        """Retrieve every selected book, in display order."""
+        selected_items = self.tree_books.selection()
+        if not selected_items:
+            messagebox.showwarning("Selection Error", "Please select a book from the list.")
+        return [self.loaded_rows[item_id] for item_id in selected_items]
+
     def edit_book(self):
         """Handle editing a book's information."""
         book = self.get_selected_book()
@@ -393,30 +3586,39 @@ class LibraryGUI:
 
     def save_edit(self, book_id, title, author, year, status, window):
         """Save the edited book information."""
-        if not title or not author or not year or not status:
-            messagebox.showwarning("Input Error", "Please fill in all fields.")
+        try:
+            if not status:
+                raise ValueError("Please fill in all fields.")
+            title, author, year = validate_book(title, author, year)
+        except ValueError as e:
+            messagebox.showwarning("Input Error", str(e))
             return
 
-        if not year.isdigit():
-            messagebox.showwarning("Input Error", "Year must be a number.")
-            return
+        def update(db):
+            # Details and status are saved as one atomic commit
+            with db.transaction():
+                db.update_book(book_id, title, author, year)
+                db.update_status(book_id, status)
 
-        try:
-            self.db.update_book(book_id, title, author, int(year))
-            self.db.update_status(book_id, status)  # Update status separately
+        def on_updated(result):
             messagebox.showinfo("Success", f"Book ID {book_id} updated successfully.")
             window.destroy()
-            self.display_books()  # Refresh the book list
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to update book. Error: {e}")
+            self.refresh_book(book_id)  # Refresh the edited row
+
+        self.executor.submit(update, on_done=on_updated,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to update book. Error: {e}"))
 
     def check_in(self):
-        """Handle checking in a book."""
-        book = self.get_selected_book()
-        if not book:
+        """Handle checking in the selected book(s)."""
+        books = self.get_selected_books()
+        if len(books) > 1:
+            if messagebox.askyesno("Confirm Check-In", f"Are you sure you want to check in {len(books)} books?"):
+                self.run_batch("check in", "checked in", LibraryDatabase.check_in_many, books)
+            return
+        if not books:
             return
 
-        book_id, title, author, year, status = book
+        book_id, title, author, year, status = books[0]
 
         if status == "Available":
             messagebox.showinfo("Info", "Book is already available.")
@@ -426,54 +3628,208 @@ class LibraryGUI:
         if not confirm:
             return
 
-        try:
-            self.db.update_status(book_id, "Available")
+        def on_checked_in(book):
             messagebox.showinfo("Success", f"Book '{title}' checked in successfully.")
-            self.display_books()  # Refresh the book list
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to check in book. Error: {e}")
+            self.refresh_book(book_id)  # Refresh the checked-in row
+
+        self.executor.submit(LibraryDatabase.check_in, book_id, on_done=on_checked_in,
+                             on_error=lambda e: self.circulation_failed("check in", book_id, e))
 
     def check_out(self):
-        """Handle checking out a book."""
-        book = self.get_selected_book()
-        if not book:
+        """Handle checking out the selected book(s)."""
+        books = self.get_selected_books()
+        if len(books) > 1:
+            borrower = simpledialog.askstring("Check Out", f"Who is borrowing these {len(books)} books?", parent=self.root)
+            if borrower is None:
+                return
+            if not borrower.strip():
+                messagebox.showwarning("Input Error", "Please enter the borrower's name.")
+                return
+            self.run_batch("check out", "checked out", LibraryDatabase.check_out_many, books, borrower.strip())
+            return
+        if not books:
             return
 
-        book_id, title, author, year, status = book
+        book_id, title, author, year, status = books[0]
 
         if status == "Checked Out":
             messagebox.showinfo("Info", "Book is already checked out.")
             return
 
-        confirm = messagebox.askyesno("Confirm Check-Out", f"Are you sure you want to check out '{title}'?")
-        if not confirm:
+        borrower = simpledialog.askstring("Check Out", f"Who is borrowing '{title}'?", parent=self.root)
+        if borrower is None:
+            return
+        borrower = borrower.strip()
+        if not borrower:
+            messagebox.showwarning("Input Error", "Please enter the borrower's name.")
             return
 
-        try:
-            self.db.update_status(book_id, "Checked Out")
-            messagebox.showinfo("Success", f"Book '{title}' checked out successfully.")
-            self.display_books()  # Refresh the book list
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to check out book. Error: {e}")
+        def on_checked_out(book):
+            messagebox.showinfo("Success", f"Book '{title}' checked out to {borrower} successfully.")
+            self.refresh_book(book_id)  # Refresh the checked-out row
+
+        self.executor.submit(LibraryDatabase.check_out, book_id, borrower, on_done=on_checked_out,
+                             on_error=lambda e: self.circulation_failed("check out", book_id, e))
+
+    def run_batch(self, action, done, func, books, *args):
+        """Run a batch operation on several books and apply the result to the loaded rows.
+
+        func(db, book_ids, *args) runs in one transaction and returns either
+        (books, conflicts) for check-in/out or the list of deleted ids.
+        Books whose status had already changed are reported, not retried.
+        """
+        search_filter = self.current_filter
+        facets = self.current_facets
+        sort = self.current_sort
+        book_ids = [book[0] for book in books]
+
+        def on_done(result):
+            if isinstance(result, tuple):
+                changed, conflicts = result
+                changes = [(book[0], book) for book in changed]
+            else:
+                deleted = set(result)
+                changes = [(book_id, None) for book_id in result]
+                conflicts = [(book_id, None) for book_id in book_ids if book_id not in deleted]
+            # Rows from another search or sort would be placed wrongly; that view reloads anyway
+            if self.current_filter == search_filter and self.current_facets == facets and self.current_sort == sort:
+                for book_id, book in changes + conflicts:
+                    if book is not None and not LibraryDatabase.book_matches(book, *search_filter,
+                                                                             self.executor.fts_enabled, facets):
+                        book = None
+                    self.apply_book_change(book_id, book)
+            message = f"{len(changes)} of {len(book_ids)} books {done} successfully."
+            if not conflicts:
+                messagebox.showinfo("Success", message)
+                return
+            skipped = ", ".join(f"{book_id} ({book[4].lower() if book else 'deleted'})" for book_id, book in conflicts[:20])
+            if len(conflicts) > 20:
+                skipped += f" and {len(conflicts) - 20} more"
+            messagebox.showwarning("Conflict", f"{message}\n\nSkipped because their status had already "
+                                               f"changed (Book ID and current status): {skipped}")
+
+        self.executor.submit(func, book_ids, *args, on_done=on_done,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to {action} books. Error: {e}"))
+
+    def circulation_failed(self, action, book_id, error):
+        """Report a failed check-in/out; on a conflict, show the book's real status."""
+        if isinstance(error, CheckoutConflict):
+            messagebox.showwarning("Conflict", f"Could not {action} the book: {error}")
+            self.refresh_book(book_id)
+        else:
+            messagebox.showerror("Error", f"Failed to {action} book. Error: {error}")
+
+    def show_report(self, title, columns, fetch):
+        """Open a window listing the rows returned by fetch(db) on the database executor."""
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry("700x400")
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120)
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+
+        def on_loaded(rows):
+            if tree.winfo_exists():
+                for row in rows:
+                    tree.insert('', tk.END, values=row)
+
+        self.executor.submit(fetch, on_done=on_loaded,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to load {title.lower()}. Error: {e}"))
+
+    def show_current_loans(self):
+        """Show the books that are currently checked out."""
+        self.show_report("Current Loans", ("Loan", "ID", "Title", "Borrower", "Checked Out", "Due"),
+                         LibraryDatabase.current_loans)
+
+    def show_overdue_loans(self):
+        """Show the loans that are past their due date."""
+        self.show_report("Overdue Loans", ("Loan", "ID", "Title", "Borrower", "Checked Out", "Due"),
+                         LibraryDatabase.overdue_loans)
+
+    def show_most_borrowed(self):
+        """Show the most borrowed books."""
+        self.show_report("Most Borrowed", ("ID", "Title", "Author", "Loans"), LibraryDatabase.most_borrowed)
+
+    def show_duplicates(self):
+        """Show groups of books that look like duplicates of each other."""
+        def fetch(db):
+            return [(group_num, *book) for group_num, group in enumerate(db.find_duplicate_groups(), 1)
+                    for book in group]
+
+        self.show_report("Possible Duplicates", ("Group", "ID", "Title", "Author", "Year", "Status"), fetch)
+
+    def show_diagnostics(self):
+        """Open a window with the query timings recorded by self.metrics."""
+        if self.metrics is None:
+            messagebox.showinfo("Diagnostics", "Query timings are not being recorded.\n"
+                                               "Start the program with --metrics to collect them.")
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("900x600")
+        columns = ("Calls", "Rows", "Total ms", "Mean ms", "p95 ms", "Max ms")
+        tree = ttk.Treeview(window, columns=columns)
+        tree.heading("#0", text="Method / Statement")
+        tree.column("#0", width=380)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=80, anchor=tk.E)
+        tree.pack(fill='both', expand=True, padx=10, pady=(10, 5))
+        slow_text = tk.Text(window, height=8, wrap='word')
+        slow_text.pack(fill='x', padx=10)
+
+        def refresh():
+            snapshot = self.metrics.snapshot()
+            tree.delete(*tree.get_children())
+            for section, label in (("methods", "Methods"), ("statements", "SQL statements")):
+                parent = tree.insert('', tk.END, text=label, open=True)
+                for name, stats in snapshot[section].items():
+                    tree.insert(parent, tk.END, text=name, values=(
+                        stats["calls"], stats["rows"], stats["total_ms"], stats["mean_ms"],
+                        stats["p95_ms"], stats["max_ms"]))
+            slow_text.delete("1.0", tk.END)
+            threshold = snapshot["slow_query_ms"]
+            slow_text.insert(tk.END, f"Slow queries (over {threshold} ms):\n" if threshold is not None
+                             else "Slow query log is off; start with --slow-query-ms to enable it.\n")
+            for entry in reversed(snapshot["slow_queries"]):
+                slow_text.insert(tk.END, f"{entry['at']}  {entry['ms']} ms  {entry['sql']}\n")
+                if entry["plan"]:
+                    slow_text.insert(tk.END, f"    Plan: {entry['plan']}\n")
+
+        def reset():
+            self.metrics.reset()
+            refresh()
+
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill='x', padx=10, pady=10)
+        ttk.Button(button_frame, text="Refresh", command=refresh).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Reset", command=reset).pack(side=tk.LEFT, padx=5)
+        refresh()
 
     def remove_book(self):
-        """Handle removing a book."""
-        book = self.get_selected_book()
-        if not book:
+        """Handle removing the selected book(s)."""
+        books = self.get_selected_books()
+        if len(books) > 1:
+            if messagebox.askyesno("Confirm Deletion", f"Are you sure you want to remove {len(books)} books?"):
+                self.run_batch("remove", "removed", LibraryDatabase.delete_books, books)
+            return
+        if not books:
             return
 
-        book_id, title, author, year, status = book
+        book_id, title, author, year, status = books[0]
 
         confirm = messagebox.askyesno("Confirm Deletion", f"Are you sure you want to remove '{title}' by {author}?")
         if not confirm:
             return
 
-        try:
-            self.db.delete_book(book_id)
+        def on_removed(count):
             messagebox.showinfo("Success", f"Book '{title}' removed successfully.")
-            self.display_books()  # Refresh the book list
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to remove book. Error: {e}")
+            self.refresh_book(book_id)  # Remove the deleted row
+
+        self.executor.submit(LibraryDatabase.delete_book, book_id, on_done=on_removed,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to remove book. Error: {e}"))
 
     def show_context_menu(self, event):
         """Display the context menu on right-click."""
@@ -484,13 +3840,21 @@ class LibraryGUI:
 
         row_id = self.tree_books.identify_row(event.y)
         if row_id:
-            # Select the row
-            self.tree_books.selection_set(row_id)
+            # Select the row, unless it is part of the selection the menu should act on
+            if row_id not in self.tree_books.selection():
+                self.tree_books.selection_set(row_id)
+            # Only Check In, Check Out and Remove work on several books at once
+            single = len(self.tree_books.selection()) == 1
+            self.context_menu.entryconfigure("Edit", state=tk.NORMAL if single else tk.DISABLED)
             # Display the context menu
             self.context_menu.post(event.x_root, event.y_root)
 
     def sort_treeview(self, col, reverse):
-        """Sort Treeview contents when a column header is clicked."""
+        """Sort the book list when a column header is clicked.
+
+        The sort is done by the database (see SORT_EXPRESSIONS), which returns
+        the first page of the current search in the new order.
+        """
         # Determine the sort order
         if self.sort_column == col:
             self.sort_reverse = not self.sort_reverse
@@ -498,29 +3862,9 @@ class LibraryGUI:
             self.sort_reverse = False
         self.sort_column = col
 
-        # Get all data from the Treeview
-        data = [(self.tree_books.set(child, col), child) for child in self.tree_books.get_children('')]
-
-        # For numerical sorting on 'ID' and 'Year'
-        if col in ("ID", "Year"):
-            try:
-                data.sort(key=lambda t: int(t[0]), reverse=self.sort_reverse)
-            except ValueError:
-                data.sort(key=lambda t: t[0], reverse=self.sort_reverse)
-        elif col == "Status":
-            # Custom sort for Status: Available before Checked Out
-            status_order = {"Available": 0, "Checked Out": 1}
-            data.sort(key=lambda t: status_order.get(t[0], 2), reverse=self.sort_reverse)
-        else:
-            # Alphabetical sorting for 'Title' and 'Author'
-            data.sort(key=lambda t: t[0].lower(), reverse=self.sort_reverse)
-
-        # Rearrange items in sorted positions
-        for index, (val, child) in enumerate(data):
-            self.tree_books.move(child, '', index)
-
-        # Update the sort indicators
+        # Update the sort indicators and reload in the new order
         self.update_sort_indicators()
+        self.display_books()
 
     def update_sort_indicators(self):
         """Update the column headers with sort indicators."""
@@ -535,22 +3879,497 @@ class LibraryGUI:
             self.tree_books.heading(self.sort_column, text=new_text, command=lambda _col=self.sort_column: self.sort_treeview(_col, not self.sort_reverse))
 
     def reset_search(self):
-        """Reset search fields and display all books."""
+        """Reset search fields and facet filters and display all books."""
         self.search_title.delete(0, tk.END)
         self.search_author.delete(0, tk.END)
+        self.current_facets = ()
         self.display_books()
         messagebox.showinfo("Search Reset", "Search filters have been cleared. Displaying all books.")
 
     def on_closing(self):
         """Handle application closing."""
-        self.db.close()
+        if self.change_poll_id is not None:
+            self.root.after_cancel(self.change_poll_id)
+            self.change_poll_id = None
+        self.executor.shutdown()
         self.root.destroy()
 
-def main():
+# Synthetic catalogue generator and benchmarks
+SYLLABLES = ("ka", "lo", "mi", "ren", "tha", "dor", "el", "vin", "sa", "mor", "qu", "ist",
+             "an", "bel", "cor", "dra", "fen", "gal", "hil", "ior", "jun", "kel", "lum", "nor")
+
+
+def make_words(rng, count, min_syllables=1, max_syllables=3):
+    """Make count distinct pronounceable pseudo-words."""
+    # Leave headroom, since different syllable sequences can spell the same word
+    if count > sum(len(SYLLABLES) ** n for n in range(min_syllables, max_syllables + 1)) // 2:
+        raise ValueError(f"Cannot make {count} distinct words of {min_syllables}-{max_syllables} syllables")
+    words = set()
+    while len(words) < count:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(min_syllables, max_syllables)))
+        words.add(word.capitalize())
+    return sorted(words)
+
+
+def generate_catalogue(db, rows, seed=0, authors=2000, vocabulary=5000, skew=1.1,
+                       checked_out_ratio=0.2, batch_size=10000):
+    """Fill db with a deterministic synthetic catalogue of rows books.
+
+    Authors and title words are drawn from Zipf-like distributions (weight
+    1 / rank ** skew), so a few authors and words are very common and most
+    are rare, like a real catalogue. Titles have 1-5 words, years are spread
+    over 1800-2025 with most after 1950, and checked_out_ratio of the books
+    are checked out to synthetic borrowers. The same seed always produces
+    the same catalogue.
+    """
+    rng = random.Random(seed)
+    author_names = [f"{first} {last}" for first, last in
+                    zip(make_words(rng, authors, 1, 3), rng.sample(make_words(rng, authors, 2, 3), authors))]
+    words = make_words(rng, vocabulary)
+    author_weights = [1 / rank ** skew for rank in range(1, authors + 1)]
+    word_weights = [1 / rank ** skew for rank in range(1, vocabulary + 1)]
+
+    book_ids = []
+    for start in range(0, rows, batch_size):
+        count = min(batch_size, rows - start)
+        title_words = rng.choices(words, word_weights, k=count * 5)
+        book_authors = rng.choices(author_names, author_weights, k=count)
+        batch = []
+        for i in range(count):
+            title = " ".join(title_words[i * 5:i * 5 + rng.randint(1, 5)])
+            year = 1800 + int(225 * rng.random() ** 0.3)
+            batch.append((title, book_authors[i], year))
+        with db.transaction():
+            # Other writers may add books between batches, so read back the ids this batch got
+            db.cursor.execute("SELECT COALESCE(MAX(BookID), 0) FROM Books")
+            last_id = db.cursor.fetchone()[0]
+            db.add_books(batch)
+            db.cursor.execute("SELECT BookID FROM Books WHERE BookID > ? ORDER BY BookID", (last_id,))
+            book_ids.extend(row[0] for row in db.cursor.fetchall())
+
+    checked_out = rng.sample(book_ids, int(rows * checked_out_ratio))
+    borrowers = make_words(rng, 500, 2, 3)
+    with db.transaction():
+        for book_id in checked_out:
+            db.check_out(book_id, rng.choice(borrowers), loan_days=rng.randint(-30, 30))
+
+
+def time_call(func, repeat):
+    """Run func repeat times and return the list of wall-clock durations in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def benchmark_database(path, rows, seed=0, repeat=3, ops=100):
+    """Benchmark the LibraryDatabase operations on a fresh synthetic catalogue at path."""
+    results = []
+
+    def record(operation, durations, count=1):
+        results.append({"rows": rows, "operation": operation, "count": count,
+                        "median_s": statistics.median(durations), "min_s": min(durations),
+                        "runs_s": durations})
+
+    db = LibraryDatabase(path)
+    try:
+        record("generate (bulk insert)", time_call(lambda: generate_catalogue(db, rows, seed), 1), rows)
+        db.cursor.execute("ANALYZE")
+
+        rng = random.Random(seed + 1)
+        sample = db.get_books_page(limit=1000)
+        word = sample[0][1].split()[0] if sample else "Ka"
+        author = sample[0][2].split()[-1] if sample else "Ka"
+
+        record("add_book", time_call(lambda: [db.add_book("Benchmark Book", "Bench Author", 2000) for _ in range(ops)], repeat), ops)
+        record("add_books (multi-row insert)", time_call(lambda: db.add_books([("Bulk Book", "Bench Author", 2001)] * ops * 10), repeat), ops * 10)
+        record("search_books prefix", time_call(lambda: db.search_books(word[:3]), repeat))
+        record("search_books author only", time_call(lambda: db.search_books(author=author), repeat))
+        record("get_books_page first page", time_call(lambda: db.get_books_page(title=word[:3], limit=100), repeat))
+        record("get_books_page sorted by title", time_call(lambda: db.get_books_page(sort=("Title", False), limit=100), repeat))
+        record("get_all_books", time_call(db.get_all_books, repeat))
+
+        like_db = LibraryDatabase(path, use_fts=False)
+        try:
+            record("search_books infix (LIKE)", time_call(lambda: like_db.search_books(word[1:4]), repeat))
+        finally:
+            like_db.close()
+
+        record("count_books", time_call(db.count_books, repeat))
+
+        def count_facets(*args, **kwargs):
+            db.facet_cache.clear()  # Time the queries, not the per-generation cache
+            return db.facet_counts(*args, **kwargs)
+
+        record("facet_counts (maintained counts)", time_call(count_facets, repeat))
+        record("facet_counts by status", time_call(lambda: count_facets(facets=(("Status", "Checked Out"),)), repeat))
+        record("facet_counts by title", time_call(lambda: count_facets(word[:3]), repeat))
+        mirror_db = LibraryDatabase(path, mirror_max_bytes=1 << 30)
+        try:
+            record("mirror load", time_call(mirror_db.load_mirror, 1), rows)
+            results[-1]["mirror_bytes"] = mirror_db.mirror.memory_bytes()
+            record("count_books (mirror)", time_call(mirror_db.count_books, repeat))
+            mirror_db.get_books_page(sort=("Title", False))  # Build the Title sort order once
+            record("get_books_page sorted by title (mirror)",
+                   time_call(lambda: mirror_db.get_books_page(sort=("Title", False), limit=100), repeat))
+        finally:
+            mirror_db.close()
+
+        ids = [book[0] for book in rng.sample(sample, min(ops, len(sample)))]
+
+        def toggle_status():
+            for book_id in ids:
+                db.update_status(book_id, "Checked Out" if db.get_book(book_id)[4] == "Available" else "Available")
+
+        record("update_status", time_call(toggle_status, repeat), len(ids))
+        record("delete_book", time_call(lambda: [db.delete_book(book_id) for book_id in ids], 1), len(ids))
+    finally:
+        db.close()
+    return results
+
+
+def benchmark_gui(path, rows, repeat=3, timeout=120.0):
+    """Benchmark startup, display_books and sort_treeview in a real Tk window (e.g. under Xvfb)."""
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return [{"rows": rows, "operation": "gui", "skipped": str(e)}]
+    results = []
+    started = time.perf_counter()
+    app = LibraryGUI(root, path, started=started)
+    try:
+        deadline = started + timeout
+        while "first_rows" not in app.startup_times and time.perf_counter() < deadline:
+            root.update()
+            time.sleep(0.001)
+        for milestone, ms in app.startup_times.items():
+            results.append({"rows": rows, "operation": f"startup {milestone}", "count": 1,
+                            "median_s": ms / 1000, "min_s": ms / 1000, "runs_s": [ms / 1000]})
+
+        def wait_for_page():
+            deadline = time.perf_counter() + timeout
+            while app.executor.is_pending("search") and time.perf_counter() < deadline:
+                root.update()
+                time.sleep(0.001)
+            root.update_idletasks()
+
+        def time_action(action):
+            def run():
+                action()
+                wait_for_page()
+            return time_call(run, repeat)
+
+        wait_for_page()
+        for operation, durations in [
+                ("display_books", time_action(lambda: (app.search_cache.entries.clear(), app.display_books()))),
+                ("sort_treeview Title", time_action(lambda: (app.search_cache.entries.clear(), app.sort_treeview("Title", False)))),
+                ("sort_treeview Year", time_action(lambda: (app.search_cache.entries.clear(), app.sort_treeview("Year", False)))),
+                ("sort_treeview Status", time_action(lambda: (app.search_cache.entries.clear(), app.sort_treeview("Status", False))))]:
+            results.append({"rows": rows, "operation": operation, "count": 1,
+                            "median_s": statistics.median(durations), "min_s": min(durations), "runs_s": durations})
+    finally:
+        app.executor.shutdown()
+        root.destroy()
+    return results
+
+
+def run_benchmarks(sizes, seed=0, repeat=3, gui=False, directory=None):
+    """Run the database (and optionally GUI) benchmarks at each size; returns a JSON-ready dict.
+
+    Each result gives the catalogue size, the operation, how many calls one
+    run made (count) and the median/min/all run times in seconds, so reports
+    from two versions can be compared entry by entry.
+    """
+    report = {
+        "timestamp": utc_timestamp(),
+        "schema_version": SCHEMA_VERSION,
+        "sqlite_version": sqlite3.sqlite_version,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, f"bench_{rows}.db")
+            report["results"].extend(benchmark_database(path, rows, seed, repeat))
+            if gui:
+                report["results"].extend(benchmark_gui(path, rows, repeat))
+    return report
+
+
+def open_database(args):
+    """Open the database named on the command line with its configured settings."""
+    return LibraryDatabase(args.db, settings=load_db_settings(args.config), metrics=args.query_metrics)
+
+
+def run_import(args):
+    """Command-line entry point for bulk importing books."""
+    db = open_database(args)
+    reject_path = args.rejects or os.path.splitext(args.path)[0] + ".rejects.csv"
+
+    def progress(imported, rejected):
+        print(f"{imported} imported, {rejected} rejected", file=sys.stderr)
+
+    try:
+        imported, rejected = import_books(db, args.path, fmt=args.format, batch_size=args.batch_size,
+                                          reject_path=reject_path, progress=progress,
+                                          check_duplicates=not args.allow_duplicates)
+    finally:
+        db.close()
+    print(f"Imported {imported} books, rejected {rejected}.")
+    if rejected:
+        print(f"Rejected rows written to {reject_path}")
+    return 0
+
+
+def run_export(args):
+    """Command-line entry point for exporting books."""
+    db = open_database(args)
+    try:
+        written = export_books(db, args.path, fmt=args.format, title=args.title, author=args.author,
+                               batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"Exported {written} books to {args.path}.")
+    return 0
+
+
+def run_check_plans(args):
+    """Command-line entry point that checks the GUI's queries use their indexes."""
+    db = open_database(args)
+    try:
+        print(f"Schema version {db.schema_version()}")
+        results = db.check_query_plans()
+    finally:
+        db.close()
+    for name, plan, ok in results:
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {plan}")
+    return 0 if all(ok for _, _, ok in results) else 1
+
+
+def run_report(args):
+    """Command-line entry point for the circulation reports."""
+    db = open_database(args)
+    try:
+        if args.report == "current":
+            rows = db.current_loans(args.limit)
+        elif args.report == "overdue":
+            rows = db.overdue_loans(limit=args.limit)
+        else:
+            rows = db.most_borrowed(args.limit)
+    finally:
+        db.close()
+    writer = csv.writer(sys.stdout)
+    for row in rows:
+        writer.writerow(row)
+    return 0
+
+
+def run_dedupe(args):
+    """Command-line entry point that lists, and optionally merges, near-duplicate books."""
+    db = open_database(args)
+    try:
+        groups = db.find_duplicate_groups(
+            progress=lambda scanned: print(f"{scanned} rows scanned", file=sys.stderr))
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["Group", "BookID", "Title", "Author", "Year", "Status"])
+        for group_num, group in enumerate(groups, 1):
+            for book in group:
+                writer.writerow([group_num, *book])
+        if args.merge:
+            merged, skipped = db.merge_duplicates(groups)
+            print(f"Merged {len(merged)} duplicate books; skipped {len(skipped)} that are checked out.", file=sys.stderr)
+    finally:
+        db.close()
+    return 0
+
+
+def run_maintain(args):
+    """Command-line entry point for the maintenance jobs.
+
+    Prints one JSON line of stats per job (and appends it to --log). With
+    --every the jobs are repeated on that schedule until interrupted.
+    """
+    while True:
+        db = open_database(args)
+        try:
+            for stats in run_maintenance(db, args.jobs, directory=args.dir, keep=args.keep, pages=args.pages,
+                                         vacuum_pages=args.vacuum_pages, full_vacuum=args.full,
+                                         keep_changes=args.keep_changes):
+                line = json.dumps(stats)
+                print(line, flush=True)
+                if args.log:
+                    with open(args.log, 'a', encoding='utf-8') as f:
+                        f.write(line + "\n")
+        finally:
+            db.close()
+        if not args.every:
+            return 0
+        try:
+            time.sleep(args.every * 60)
+        except KeyboardInterrupt:
+            return 0
+
+
+def run_generate(args):
+    """Command-line entry point for generating a synthetic catalogue."""
+    db = open_database(args)
+    try:
+        generate_catalogue(db, args.rows, seed=args.seed, authors=args.authors,
+                           checked_out_ratio=args.checked_out_ratio)
+    finally:
+        db.close()
+    print(f"Generated {args.rows} books in {args.db}.")
+    return 0
+
+
+def run_bench(args):
+    """Command-line entry point for the benchmark suite."""
+    report = run_benchmarks(args.sizes, seed=args.seed, repeat=args.repeat, gui=args.gui, directory=args.dir)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+def run_server(args):
+    """Command-line entry point for the headless HTTP/JSON service."""
+    pool = ConnectionPool(args.db, size=args.pool_size, settings=load_db_settings(args.config), timeout=args.timeout,
+                          metrics=args.query_metrics)
+    server = LibraryHTTPServer((args.host, args.port), pool, workers=args.workers,
+                               max_pending=args.max_pending, request_timeout=args.timeout)
+    print(f"Serving {args.db} on http://{args.host}:{server.server_port}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments; with no command the GUI is started."""
+    parser = argparse.ArgumentParser(description="Library Management System")
+    parser.add_argument("--db", default="library.db", help="path to the SQLite database")
+    parser.add_argument("--config", help="INI file with a [database] section of connection settings (default: library.ini)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record query timings (Tools > Diagnostics, GET /metrics, or printed to stderr after a command)")
+    parser.add_argument("--slow-query-ms", type=float,
+                        help="log queries slower than this with their query plan to stderr (implies --metrics)")
+    parser.add_argument("--startup-report", action="store_true", help="print the GUI's startup timings to stderr")
+    parser.add_argument("--mirror-mb", type=int,
+                        help="keep an in-memory copy of the catalogue of up to this many MiB for faster browsing")
+    commands = parser.add_subparsers(dest="command")
+
+    import_parser = commands.add_parser("import", help="bulk import books from a CSV or JSON Lines file")
+    import_parser.add_argument("path", help="file with Title, Author and Year columns/keys")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from the file extension)")
+    import_parser.add_argument("--batch-size", type=int, default=5000, help="rows inserted per transaction")
+    import_parser.add_argument("--rejects", help="where to write rejected rows (default: <path>.rejects.csv)")
+    import_parser.add_argument("--allow-duplicates", action="store_true",
+                               help="import rows that look like books already in the catalogue or file")
+    import_parser.set_defaults(handler=run_import)
+
+    export_parser = commands.add_parser("export", help="export books to CSV, JSON Lines or Parquet")
+    export_parser.add_argument("path", help="output file")
+    export_parser.add_argument("--format", choices=("csv", "jsonl", "parquet"), help="output format (default: from the file extension)")
+    export_parser.add_argument("--title", default="", help="only export books whose title matches")
+    export_parser.add_argument("--author", default="", help="only export books whose author matches")
+    export_parser.add_argument("--batch-size", type=int, default=5000, help="rows fetched per batch")
+    export_parser.set_defaults(handler=run_export)
+
+    plans_parser = commands.add_parser("check-plans", help="upgrade the schema and check that queries use their indexes")
+    plans_parser.set_defaults(handler=run_check_plans)
+
+    report_parser = commands.add_parser("report", help="print a circulation report as CSV")
+    report_parser.add_argument("report", choices=("current", "overdue", "popular"), help="which report to print")
+    report_parser.add_argument("--limit", type=int, default=100, help="maximum rows to print")
+    report_parser.set_defaults(handler=run_report)
+
+    dedupe_parser = commands.add_parser("dedupe", help="print groups of near-duplicate books as CSV")
+    dedupe_parser.add_argument("--merge", action="store_true",
+                               help="keep the oldest book of each group and move the others' loan history to it")
+    dedupe_parser.set_defaults(handler=run_dedupe)
+
+    maintain_parser = commands.add_parser("maintain", help="back up, snapshot, optimize or vacuum the database")
+    maintain_parser.add_argument("jobs", nargs="+", choices=MAINTENANCE_JOBS,
+                                 help="jobs to run in order: backup (online copy), snapshot (compacted VACUUM INTO "
+                                      "copy), optimize, analyze, vacuum, prune (trim the change log)")
+    maintain_parser.add_argument("--dir", default="backups", help="directory for backups and snapshots")
+    maintain_parser.add_argument("--keep", type=int, default=7, help="backups and snapshots of each kind to keep")
+    maintain_parser.add_argument("--pages", type=int,
+                                 help="pages copied per backup step (default: all at once in WAL mode, else 256)")
+    maintain_parser.add_argument("--vacuum-pages", type=int, help="free pages to return per incremental vacuum (default: all)")
+    maintain_parser.add_argument("--full", action="store_true",
+                                 help="rebuild the whole file with VACUUM (also converts it to the auto_vacuum setting)")
+    maintain_parser.add_argument("--keep-changes", type=int, default=100000,
+                                 help="change log entries kept by prune, for other windows to catch up from")
+    maintain_parser.add_argument("--every", type=float, help="repeat the jobs every this many minutes until interrupted")
+    maintain_parser.add_argument("--log", help="also append the JSON stats lines to this file")
+    maintain_parser.set_defaults(handler=run_maintain)
+
+    generate_parser = commands.add_parser("generate", help="add a deterministic synthetic catalogue to the database")
+    generate_parser.add_argument("--rows", type=int, default=10000, help="number of books to generate")
+    generate_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    generate_parser.add_argument("--authors", type=int, default=2000, help="number of distinct authors")
+    generate_parser.add_argument("--checked-out-ratio", type=float, default=0.2, help="fraction of books checked out")
+    generate_parser.set_defaults(handler=run_generate)
+
+    bench_parser = commands.add_parser("bench", help="benchmark LibraryDatabase on synthetic catalogues and print JSON")
+    bench_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="catalogue sizes")
+    bench_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    bench_parser.add_argument("--repeat", type=int, default=3, help="runs per timed operation")
+    bench_parser.add_argument("--gui", action="store_true", help="also benchmark the Tk GUI (needs a display, e.g. xvfb-run)")
+    bench_parser.add_argument("--dir", help="directory for the temporary databases")
+    bench_parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    bench_parser.set_defaults(handler=run_bench)
+
+    serve_parser = commands.add_parser("serve", help="run the headless HTTP/JSON API")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    serve_parser.add_argument("--workers", type=int, default=8, help="request handler threads")
+    serve_parser.add_argument("--pool-size", type=int, default=4, help="pooled database connections")
+    serve_parser.add_argument("--max-pending", type=int, default=64, help="requests allowed to wait before answering 503")
+    serve_parser.add_argument("--timeout", type=float, default=10.0, help="seconds allowed per request")
+    serve_parser.set_defaults(handler=run_server)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    started = time.perf_counter()
+    args = parse_args(argv)
+    args.query_metrics = None
+    if args.metrics or args.slow_query_ms is not None:
+        args.query_metrics = QueryMetrics(slow_query_ms=args.slow_query_ms)
+    if args.command:
+        try:
+            return args.handler(args)
+        except (OSError, ValueError, RuntimeError, sqlite3.Error) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        finally:
+            if args.query_metrics is not None:
+                print(json.dumps(args.query_metrics.snapshot(), indent=2), file=sys.stderr)
+
+    try:
+        settings = load_db_settings(args.config)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
     root = tk.Tk()
-    app = LibraryGUI(root)
+    app = LibraryGUI(root, args.db, settings, args.query_metrics, started=started, report_startup=args.startup_report,
+                     mirror_max_bytes=None if args.mirror_mb is None else args.mirror_mb << 20)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,422 @@
+"""Consistency tests for Library_Management_System_v10.
+
+Run with: python -m unittest test_Library_Management_System_v10
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+from collections import Counter
+from datetime import datetime
+from unittest import mock
+
+import Library_Management_System_v10 as library
+
+SORTS = [None, ("ID", True), ("Title", False), ("Title", True), ("Author", False), ("Author", True),
+         ("Year", False), ("Year", True), ("Status", False), ("Status", True)]
+FILTERS = [("", ""), ("an", ""), ("", "an"), ("AN", "el"), ("lo mi", ""), ("", ", an"), ("zzz", "")]
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Give each test a fresh database file in its own temporary directory."""
+
+    def setUp(self):
+        self.path = self.temporary_path()
+
+    def temporary_path(self):
+        """Return a database path in a new temporary directory that is removed after the test."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return os.path.join(directory.name, "library.db")
+
+    def open(self, path=None, **kwargs):
+        db = library.LibraryDatabase(path or self.path, **kwargs)
+        self.addCleanup(db.close)
+        return db
+
+
+class TransactionTest(DatabaseTestCase):
+    """transaction() commits once at the outermost block and rolls back only the failing block."""
+
+    def test_nested_block_rolls_back_to_its_savepoint(self):
+        db = self.open()
+        with db.transaction():
+            db.add_book("Kept", "Author", 2000)
+            with self.assertRaises(ValueError):
+                with db.transaction():
+                    db.add_book("Rolled back", "Author", 2001)
+                    raise ValueError("inner block fails")
+            db.add_book("Also kept", "Author", 2002)
+        self.assertEqual([book[1] for book in db.get_all_books()], ["Kept", "Also kept"])
+        self.assertEqual(db.transaction_depth, 0)
+        self.assertFalse(db.conn.in_transaction)
+
+    def test_error_in_outer_block_rolls_back_everything(self):
+        db = self.open()
+        with self.assertRaises(ValueError):
+            with db.transaction():
+                db.add_book("Gone", "Author", 2000)
+                with db.transaction():
+                    db.add_book("Gone too", "Author", 2001)
+                raise ValueError("outer block fails")
+        self.assertEqual(db.count_books(), 0)
+        self.assertFalse(db.conn.in_transaction)
+
+    def test_failed_commit_rolls_back_and_leaves_connection_usable(self):
+        # Under a rollback journal COMMIT needs every reader gone, so a reader makes it fail
+        db = self.open(settings=dict(library.DEFAULT_DB_SETTINGS, journal_mode="DELETE", busy_timeout=200))
+        reader = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(reader.close)
+        reader.execute("BEGIN")
+        reader.execute("SELECT COUNT(*) FROM Books").fetchone()
+        with self.assertRaises(sqlite3.OperationalError):
+            db.add_book("Not committed", "Author", 2000)
+        self.assertFalse(db.conn.in_transaction)
+        self.assertEqual(db.transaction_depth, 0)
+
+        reader.execute("COMMIT")
+        db.add_book("Committed", "Author", 2001)
+        self.assertEqual([book[1] for book in db.get_all_books()], ["Committed"])
+
+
+class ImportTest(DatabaseTestCase):
+    """Bulk import of CSV and JSON Lines files."""
+
+    def test_csv_with_byte_order_mark(self):
+        # Excel saves "CSV UTF-8" with a BOM in front of the header
+        path = os.path.join(os.path.dirname(self.path), "books.csv")
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            f.write("title,author,year\r\nThe Hobbit,J. R. R. Tolkien,1937\r\nDune,Frank Herbert,1965\r\n")
+        db = self.open()
+        self.assertEqual(library.import_books(db, path), (2, 0))
+        self.assertEqual([book[1:4] for book in db.get_all_books()],
+                         [("The Hobbit", "J. R. R. Tolkien", 1937), ("Dune", "Frank Herbert", 1965)])
+
+
+class CheckoutTest(DatabaseTestCase):
+    """A copy can only be lent once: the loser of a race gets a CheckoutConflict."""
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.open()
+        self.book_id = self.db.add_book("The Hobbit", "J. R. R. Tolkien", 1937)
+
+    def open_loans(self, book_id):
+        self.db.cursor.execute("SELECT COUNT(*) FROM Loans WHERE BookID = ? AND ReturnedAt IS NULL", (book_id,))
+        return self.db.cursor.fetchone()[0]
+
+    def test_second_check_out_conflicts(self):
+        self.assertEqual(self.db.check_out(self.book_id, "Ann")[4], "Checked Out")
+        other_desk = self.open()
+        with self.assertRaises(library.CheckoutConflict) as raised:
+            other_desk.check_out(self.book_id, "Bob")
+        self.assertEqual(raised.exception.status, "Checked Out")
+        self.assertEqual(self.open_loans(self.book_id), 1)
+        self.db.cursor.execute("SELECT Borrower FROM Loans WHERE BookID = ?", (self.book_id,))
+        self.assertEqual(self.db.cursor.fetchall(), [("Ann",)])
+
+    def test_second_check_in_conflicts(self):
+        self.db.check_out(self.book_id, "Ann")
+        self.assertEqual(self.db.check_in(self.book_id)[4], "Available")
+        with self.assertRaises(library.CheckoutConflict) as raised:
+            self.open().check_in(self.book_id)
+        self.assertEqual(raised.exception.status, "Available")
+        self.assertEqual(self.open_loans(self.book_id), 0)
+
+    def test_missing_book(self):
+        self.assertIsNone(self.db.check_out(self.book_id + 1, "Ann"))
+        self.assertIsNone(self.db.check_in(self.book_id + 1))
+
+    def test_batches_return_already_changed_books_as_conflicts(self):
+        ids = [self.db.add_book(f"Book {n}", "Author", 2000) for n in range(4)]
+        taken = self.db.check_out(ids[0], "Ann")
+        missing = ids[-1] + 1
+        books, conflicts = self.db.check_out_many(ids + [missing], "Bob")
+        self.assertEqual([book[0] for book in books], ids[1:])
+        self.assertTrue(all(book[4] == "Checked Out" for book in books))
+        self.assertEqual(conflicts, [(ids[0], taken), (missing, None)])
+        self.assertEqual([self.open_loans(book_id) for book_id in ids], [1, 1, 1, 1])
+
+        returned = self.db.check_in(ids[1])
+        books, conflicts = self.db.check_in_many(ids + [missing])
+        self.assertEqual([book[0] for book in books], [ids[0], ids[2], ids[3]])
+        self.assertTrue(all(book[4] == "Available" for book in books))
+        self.assertEqual(conflicts, [(ids[1], returned), (missing, None)])
+        self.assertEqual([self.open_loans(book_id) for book_id in ids], [0, 0, 0, 0])
+
+
+class CatalogueMirrorTest(DatabaseTestCase):
+    """The mirror must page and count exactly like the SQL keyset path."""
+
+    def setUp(self):
+        super().setUp()
+        # Without FTS every title/author filter is a substring match the mirror can answer
+        self.db = self.open(use_fts=False, mirror_max_bytes=64 << 20)
+        library.generate_catalogue(self.db, 600, seed=3, authors=40, vocabulary=60)
+        self.db.load_mirror()
+        self.sql = self.open(use_fts=False)
+        self.rng = random.Random(1)
+
+    def assert_same_pages(self, title, author, sort, limit=37):
+        self.assertIsNotNone(self.db.catalogue(title, author))
+        expected = self.sql.get_books_page(title, author, sort, limit=limit)
+        self.assertEqual(self.db.get_books_page(title, author, sort, limit=limit), expected)
+        while expected:
+            following = self.sql.get_books_page(title, author, sort, after=expected[-1], limit=limit)
+            self.assertEqual(self.db.get_books_page(title, author, sort, after=expected[-1], limit=limit), following)
+            if following:
+                self.assertEqual(self.db.get_books_page(title, author, sort, before=following[0], limit=limit),
+                                 self.sql.get_books_page(title, author, sort, before=following[0], limit=limit))
+            expected = following
+        for status in (None, "Available", "Checked Out"):
+            self.assertEqual(self.db.count_books(title, author, status), self.sql.count_books(title, author, status))
+
+    def assert_same_catalogue(self):
+        for title, author in FILTERS:
+            for sort in SORTS:
+                with self.subTest(title=title, author=author, sort=sort):
+                    self.assert_same_pages(title, author, sort)
+
+    def book_ids(self):
+        return [book[0] for book in self.sql.get_all_books()]
+
+    def test_pages_match_sql(self):
+        self.assert_same_catalogue()
+
+    def test_pages_match_sql_after_local_writes(self):
+        db, rng = self.db, self.rng
+        db.add_book("Anlo Zeta", "Mi Anel", 1999)
+        db.add_books([("Bulk An", "Lo, Mi", 1950)] * 5)
+        for book_id in rng.sample(self.book_ids(), 20):
+            db.update_book(book_id, rng.choice(["Renamed", "an mi", "Lo"]), rng.choice(["Anel, X", "b"]), 1900)
+        db.check_in_many(rng.sample(self.book_ids(), 40))
+        db.check_out_many(rng.sample(self.book_ids(), 40), "Borrower")
+        db.delete_books(rng.sample(self.book_ids(), 50))  # Leaves tombstones in the mirror
+        self.assert_same_catalogue()
+
+    def test_pages_match_sql_after_external_writes(self):
+        other, rng = self.open(use_fts=False), self.rng
+        other.add_book("External An", "Lo Mi", 2001)
+        for book_id in rng.sample(self.book_ids(), 20):
+            other.update_book(book_id, "Changed elsewhere", "An Other", 1980)
+        other.check_out_many(rng.sample(self.book_ids(), 30), "Borrower")
+        other.delete_books(rng.sample(self.book_ids(), 30))
+        self.assert_same_catalogue()
+        self.assertTrue(self.db.mirror.loaded)
+
+
+class SchemaMigrationTest(DatabaseTestCase):
+    """Every earlier user_version upgrades in place to SCHEMA_VERSION."""
+
+    BOOKS = [("The Hobbit", "J. R. R. Tolkien", 1937, "Checked Out"),
+             ("The Hobbit", "Tolkien, J.R.R.", 1937, "Available"),
+             ("Dune", "Frank Herbert", 1965, "Available"),
+             ("Emma", "Jane Austen", 1815, "Checked Out")]
+
+    def create_database(self, version):
+        """Build a database at user_version version holding BOOKS and return its path."""
+        path = self.temporary_path()
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.create_function("normalize_title", 1, library.normalize_title, deterministic=True)
+        conn.create_function("normalize_author", 1, library.normalize_author, deterministic=True)
+        conn.create_function("dedupe_key", 2, library.dedupe_key, deterministic=True)
+        # Version 0 is a library.db from before versioning: the original Books table only.
+        # The books go in first, as if the database had been upgraded version by version since.
+        for statement in library.SCHEMA_MIGRATIONS[0]:
+            conn.execute(statement)
+        conn.executemany("INSERT INTO Books (Title, Author, Year, Status) VALUES (?, ?, ?, ?)", self.BOOKS)
+        for statements in library.SCHEMA_MIGRATIONS[1:version]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.close()
+        return path
+
+    def assert_upgraded(self, path):
+        db = self.open(path)
+        self.assertEqual(db.schema_version(), library.SCHEMA_VERSION)
+        self.assertEqual([book[1:] for book in db.get_all_books()], self.BOOKS)
+        # Checked-out books have an open loan, and the derived columns are filled in
+        db.cursor.execute("SELECT BookID FROM Loans WHERE ReturnedAt IS NULL ORDER BY BookID")
+        self.assertEqual([row[0] for row in db.cursor.fetchall()], [1, 4])
+        db.cursor.execute("SELECT Title, Author, TitleNorm, AuthorNorm, DedupeKey FROM Books")
+        for title, author, *keys in db.cursor.fetchall():
+            self.assertEqual(tuple(keys), library.book_keys(title, author))
+        self.assertEqual(len(db.find_duplicate_groups()), 1)
+        self.assertEqual(maintained_facet_counts(db), grouped_facet_counts(db))
+        self.assertEqual(db.count_books("hobbit"), 2)
+        # Opening again is a no-op
+        db.close()
+        self.assertEqual(self.open(path).schema_version(), library.SCHEMA_VERSION)
+
+    def test_upgrade_from_each_version(self):
+        for version in range(library.SCHEMA_VERSION):
+            with self.subTest(version=version):
+                self.assert_upgraded(self.create_database(version))
+
+
+class QueryPlanTest(DatabaseTestCase):
+    """The queries the program builds use their indexes, before and after ANALYZE."""
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.open()
+        library.generate_catalogue(self.db, 2000, seed=7, authors=50, vocabulary=80)
+        self.db.check_out_many(range(1, 200), "Reader")
+
+    def assert_plans_ok(self):
+        for name, plan, ok in self.db.check_query_plans():
+            with self.subTest(name=name):
+                self.assertTrue(ok, plan)
+
+    def test_plans_use_indexes(self):
+        self.assert_plans_ok()
+
+    def test_plans_use_indexes_after_analyze(self):
+        self.db.optimize(analyze=True)
+        self.assert_plans_ok()
+
+    def test_page_check_runs_the_page_query(self):
+        checks = {name: (query, params) for name, query, params, _ in self.db.indexed_queries()}
+        sql = self.db.page_query(sort=("Title", True), after=(1, "m", "m", 1950, "Available"))
+        self.assertEqual(checks["next page by Title descending"], sql)
+
+
+def maintained_facet_counts(db):
+    db.cursor.execute("SELECT Facet, Value, Books FROM BookFacetCounts")
+    return sorted(db.cursor.fetchall())
+
+
+def grouped_facet_counts(db):
+    db.cursor.execute("""
+        SELECT 'Status', Status, COUNT(*) FROM Books GROUP BY Status
+        UNION ALL SELECT 'Decade', Year / 10 * 10, COUNT(*) FROM Books GROUP BY Year / 10 * 10
+        UNION ALL SELECT 'Author', AuthorNorm, COUNT(*) FROM Books GROUP BY AuthorNorm
+    """)
+    return sorted(db.cursor.fetchall())
+
+
+class FacetCountsTest(DatabaseTestCase):
+    """BookFacetCounts and facet_counts agree with counting the books directly."""
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.open()
+        library.generate_catalogue(self.db, 800, seed=5, authors=30, vocabulary=50)
+
+    def random_writes(self, db, rng, count):
+        for _ in range(count):
+            book_ids = [book[0] for book in db.get_all_books()]
+            book_id = rng.choice(book_ids)
+            operation = rng.randrange(6)
+            if operation == 0:
+                db.add_book(rng.choice(["New", "Another"]), rng.choice(["Frank Herbert", "Herbert, Frank", "X Y"]),
+                            rng.randint(1800, 2025))
+            elif operation == 1:
+                db.add_books([("Bulk", "Bulk Author", 1999)] * rng.randint(1, 4))
+            elif operation == 2:
+                book = db.get_book(book_id)
+                db.update_book(book_id, book[1], rng.choice([book[2], "Frank Herbert", "Jane Austen"]),
+                               rng.choice([book[3], book[3] + 1, book[3] + 10, 1955]))
+            elif operation == 3:
+                db.update_status(book_id, rng.choice(["Available", "Checked Out"]))
+            elif operation == 4:
+                db.check_in_many(rng.sample(book_ids, 5))
+                db.check_out_many(rng.sample(book_ids, 5), "Borrower")
+            else:
+                db.delete_books(rng.sample(book_ids, rng.randint(1, 3)))
+
+    def expected_counts(self, title="", author="", facets=(), top_authors=10):
+        """facet_counts worked out in Python from every book row."""
+        books = self.db.get_all_books()
+        fts = self.db.fts_enabled
+        result = {}
+        for facet in library.FACET_NAMES:
+            others = tuple(item for item in facets if item[0] != facet)
+            counter = Counter(library.facet_value(facet, book) for book in books
+                              if library.LibraryDatabase.book_matches(book, title, author, fts, others))
+            if facet == "Author":
+                result[facet] = sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:top_authors]
+            else:
+                result[facet] = sorted(counter.items())
+        return result
+
+    def assert_facet_counts(self, title="", author="", facets=()):
+        counts = self.db.facet_counts(title, author, facets)
+        self.assertEqual({facet: [(value, count) for value, _, count in rows] for facet, rows in counts.items()},
+                         self.expected_counts(title, author, facets))
+
+    def test_trigger_counts_match_group_by(self):
+        self.assertEqual(maintained_facet_counts(self.db), grouped_facet_counts(self.db))
+        self.random_writes(self.db, random.Random(2), 150)
+        self.assertEqual(maintained_facet_counts(self.db), grouped_facet_counts(self.db))
+
+    def test_failed_write_leaves_counts_unchanged(self):
+        before = maintained_facet_counts(self.db)
+        with self.db.transaction():
+            # add_books rolls back to its savepoint, so the caller can carry on
+            with self.assertRaises(sqlite3.IntegrityError):
+                self.db.add_books([("Kept", "Nobody", 2000)] * 200 + [("Rejected", "Nobody", None)])
+        self.assertEqual(maintained_facet_counts(self.db), before)
+        self.assertEqual(self.db.count_books(), 800)
+
+    def test_facet_counts_match_books(self):
+        self.random_writes(self.db, random.Random(4), 40)
+        author = self.db.facet_counts()["Author"][0][0]
+        for title, author_filter, facets in [("", "", ()), ("an", "", ()), ("", "", (("Status", "Available"),)),
+                                             ("", "", (("Decade", 1950),)),
+                                             ("", "", (("Author", author), ("Status", "Checked Out"))),
+                                             ("an", "an", (("Decade", 1990), ("Status", "Available")))]:
+            with self.subTest(title=title, author=author_filter, facets=facets):
+                self.assert_facet_counts(title, author_filter, facets)
+
+    def test_counts_follow_writes_from_other_connections(self):
+        self.assert_facet_counts()
+        self.random_writes(self.open(), random.Random(6), 20)
+        self.assert_facet_counts()
+
+
+class FrozenClock(datetime):
+    """A datetime whose now() never moves, as on a clock coarser than the jobs."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 5, 1, 3, 0, 0, tzinfo=tz)
+
+
+class MaintenanceTest(DatabaseTestCase):
+    """Backups and snapshots made in the same instant get their own files."""
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.open()
+        self.db.add_book("The Hobbit", "J. R. R. Tolkien", 1937)
+        self.directory = os.path.join(os.path.dirname(self.path), "backups")
+
+    def run_jobs(self, jobs, keep=7):
+        with mock.patch.object(library, "datetime", FrozenClock):
+            return list(library.run_maintenance(self.db, jobs, directory=self.directory, keep=keep))
+
+    def test_copies_in_the_same_instant_are_kept(self):
+        stats = self.run_jobs(["backup", "snapshot", "backup", "snapshot", "backup"])
+        paths = [job["path"] for job in stats]
+        self.assertEqual(len(set(paths)), 5)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(os.path.basename(path) for path in paths))
+        for path in paths:
+            copy = self.open(path)
+            self.assertEqual(copy.count_books(), 1)
+
+    def test_prune_removes_the_oldest_copies(self):
+        first, second, third = (job["path"] for job in self.run_jobs(["backup"] * 3, keep=2))
+        self.assertEqual(sorted(os.listdir(self.directory)), [os.path.basename(second), os.path.basename(third)])
+
+    def test_prune_matches_copies_named_without_microseconds(self):
+        os.makedirs(self.directory)
+        old = os.path.join(self.directory, "library-20240101-000000.backup.db")
+        open(old, "w").close()
+        self.assertEqual(self.run_jobs(["backup"], keep=1)[0]["pruned"], [old])
+
+
+if __name__ == "__main__":
+    unittest.main()